@@ -0,0 +1,220 @@
+"""Generates a synthetic EMB3D tree for benchmarks.
+
+The tree has the layout read by main.py: the three `_data/*_mappings.json`
+files and the `threats/TID-*.html` and `mitigations/MID-*.html` pages. At scale
+1 it has roughly the size of the real catalogue.
+
+    python benchmarks/generate_corpus.py OUT/bench/emb3d --scale 10
+"""
+
+import argparse
+import json
+import random
+from pathlib import Path
+
+# size of the real EMB3D catalogue
+BASE_COUNTS = {
+    "threats": 80,
+    "mitigations": 85,
+    "properties": 57,
+    "cwes": 64,
+    "cves": 67,
+}
+
+CATEGORIES = ["hardware", "systemSoftware", "applicationSoftware", "networking"]
+LEVELS = ["Foundational", "Intermediate", "Leading"]
+
+WORDS = (
+    "device firmware bootloader kernel memory attacker update integrity network "
+    "protocol authentication key storage process privilege access driver module "
+    "hardware debug interface secure boot code execution data"
+).split()
+
+
+def sentence(rng, words=12):
+    """Returns a random sentence."""
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def paragraph(rng, sentences=4):
+    """Returns a random paragraph."""
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+
+def property_ids(count):
+    """Returns hierarchical property ids (PID-1, PID-11, PID-111, ...)."""
+    ids, queue = [], [f"PID-{i}" for i in range(1, 10)]
+    while len(ids) < count:
+        pid = queue.pop(0)
+        ids.append(pid)
+        queue.extend(f"{pid}{i}" for i in range(1, 4))
+    return ids
+
+
+def threat_page(rng, tid, cwes, cves):
+    """Returns the HTML page of a threat."""
+    evidence = "".join(f"<li>{sentence(rng)}</li>" for _ in range(rng.randint(1, 4)))
+    cwe = "".join(f"<li>{c}: {sentence(rng, 5)} “{sentence(rng)}”</li>" for c in cwes)
+    cve = "".join(f"<li>{c} “{sentence(rng)}”</li>" for c in cves)
+    refs = "".join(
+        f"<li>{sentence(rng, 6)} https://example.org/{tid}/{i}</li>"
+        for i in range(rng.randint(1, 3))
+    )
+    return f"""<!DOCTYPE html>
+<html>
+<head><title>{tid}</title></head>
+<body>
+<article>
+<h1>{tid}: {sentence(rng, 5)}</h1>
+<div id="threattitle">{tid}</div>
+<div>
+<h2>Threat Description</h2>
+<p>{paragraph(rng)}</p>
+<p>{paragraph(rng)}</p>
+<h2>Threat Maturity and Evidence</h2>
+<ul>{evidence}</ul>
+<h2>CWE</h2>
+<ul>{cwe}</ul>
+<h2>CVE</h2>
+<ul>{cve}</ul>
+<h2>References</h2>
+<ul>{refs}</ul>
+</div>
+</article>
+</body>
+</html>
+"""
+
+
+def mitigation_page(rng, mid):
+    """Returns the HTML page of a mitigation."""
+    iec = "".join(
+        f"<li>CR {rng.randint(1, 7)}.{rng.randint(1, 14)} - {sentence(rng, 4)}</li>"
+        for _ in range(rng.randint(1, 3))
+    )
+    return f"""<!DOCTYPE html>
+<html>
+<head><title>{mid}</title></head>
+<body>
+<article>
+<h1>{mid}: {sentence(rng, 5)}</h1>
+<div id="mitigationTitle">{mid}</div>
+<h2>Description</h2>
+<p>{paragraph(rng)}</p>
+<p>{paragraph(rng)}</p>
+<h2>IEC 62443 4-2 Mappings</h2>
+<ul>{iec}</ul>
+<h2>References</h2>
+<p>{sentence(rng, 6)} https://example.org/{mid}</p>
+</article>
+</body>
+</html>
+"""
+
+
+def generate_corpus(root, scale=1, seed=0):
+    """Writes a synthetic EMB3D tree.
+
+    Args:
+        root (str): The directory of the tree, created if needed.
+        scale (float, optional): The size relative to the real catalogue.
+                                 Defaults to 1.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        dict: The number of threats, mitigations, properties, CWEs and CVEs.
+    """
+    rng = random.Random(seed)
+    counts = {k: max(2, round(v * scale)) for k, v in BASE_COUNTS.items()}
+    root = Path(root)
+    for directory in ("_data", "threats", "mitigations"):
+        (root / directory).mkdir(parents=True, exist_ok=True)
+
+    tids = [f"TID-{101 + i}" for i in range(counts["threats"])]
+    mids = [f"MID-{1 + i:03d}" for i in range(counts["mitigations"])]
+    pids = property_ids(counts["properties"])
+    cwes = [f"CWE-{1000 + i}" for i in range(counts["cwes"])]
+    cves = [f"CVE-2024-{10000 + i}" for i in range(counts["cves"])]
+    texts = {pid: f"Device includes {sentence(rng, 6).lower()}" for pid in pids}
+    names = {x: sentence(rng, 5) for x in tids + mids}
+
+    threats = []
+    for tid in tids:
+        threats.append(
+            {
+                "id": tid,
+                "name": names[tid],
+                "category": rng.choice(CATEGORIES),
+                "properties": [
+                    {"id": pid, "text": texts[pid]}
+                    for pid in rng.sample(pids, min(len(pids), rng.randint(1, 6)))
+                ],
+                "mitigations": [
+                    {"id": mid, "name": names[mid], "level": rng.choice(LEVELS)}
+                    for mid in rng.sample(mids, min(len(mids), rng.randint(2, 8)))
+                ],
+            }
+        )
+
+    # reverse mappings
+    sub_props = {pid: [] for pid in pids}
+    threats_of = {x: [] for x in pids + mids}
+    for pid in pids:
+        if pid[:-1] in sub_props:
+            sub_props[pid[:-1]].append(pid)
+    for t in threats:
+        for rel in t["properties"] + t["mitigations"]:
+            threats_of[rel["id"]].append({"id": t["id"], "name": t["name"]})
+
+    properties = [
+        {
+            "id": pid,
+            "text": texts[pid],
+            "isparentProp": bool(sub_props[pid]),
+            "parentProp": pid[:-1] if pid[:-1] in sub_props else "",
+            "subProps": sub_props[pid],
+            "threats": threats_of[pid],
+        }
+        for pid in pids
+    ]
+    mitigations = [
+        {
+            "id": mid,
+            "name": names[mid],
+            "level": rng.choice(LEVELS),
+            "threats": threats_of[mid],
+        }
+        for mid in mids
+    ]
+
+    for name, key, value in [
+        ("threats_properties_mitigations_mappings.json", "threats", threats),
+        ("properties_threat_mappings.json", "properties", properties),
+        ("mitigations_threat_mappings.json", "mitigations", mitigations),
+    ]:
+        with open(root / "_data" / name, "w") as f:
+            json.dump({key: value}, f, indent=2)
+
+    for tid in tids:
+        page = threat_page(
+            rng, tid, rng.sample(cwes, rng.randint(1, 3)), rng.sample(cves, 2)
+        )
+        (root / "threats" / f"{tid}.html").write_text(page)
+    for mid in mids:
+        (root / "mitigations" / f"{mid}.html").write_text(mitigation_page(rng, mid))
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="directory of the generated EMB3D tree")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1,
+        help="size relative to the real catalogue (default: 1)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+    print(generate_corpus(args.root, args.scale, args.seed))
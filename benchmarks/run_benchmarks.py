@@ -0,0 +1,157 @@
+"""Times each stage of the conversion on synthetic EMB3D trees.
+
+For every scale factor a tree is generated with `generate_corpus` and converted
+in a fresh process, so the peak memory measured is that of the conversion alone,
+without the generation of the tree or the conversions of the other scales.
+
+    python benchmarks/run_benchmarks.py --scales 1 10 100 --output OUT/bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generate_corpus import generate_corpus  # noqa: E402
+
+
+def run_stages(root, output, jobs=1, trace_memory=False):
+    """Converts an EMB3D tree with the profiler of the converter.
+
+    Args:
+        root (str): The path of the EMB3D tree.
+        output (str): The path of the bundle.
+        jobs (int, optional): The number of HTML parsing processes. Defaults to 1.
+        trace_memory (bool, optional): Whether to measure the peak memory
+                                       allocated by each stage with tracemalloc,
+                                       which slows the run down. Defaults to False.
+
+    Returns:
+        dict: The results, with the stages of `Profiler.report` in order. The
+              peak memory of the HTML parsing processes, with `jobs` > 1, is
+              the largest of them (`peak_children_rss_kb`).
+    """
+    from converter import Converter
+    from export import write_bundle
+
+    converter = Converter(root, jobs=jobs, profile=True)
+    if trace_memory:
+        tracemalloc.start()
+    converter.run([partial(write_bundle, filename=output)])
+    if trace_memory:
+        tracemalloc.stop()
+
+    report = converter.profiler.report()
+    return {
+        "objects": sum(report["objects"].values()),
+        "relationships": report["objects"]["relationships"],
+        "total_seconds": report["total_seconds"],
+        "peak_rss_kb": report["peak_rss_kb"],
+        # kilobytes on Linux
+        "peak_children_rss_kb": resource.getrusage(
+            resource.RUSAGE_CHILDREN
+        ).ru_maxrss,
+        "stages": report["stages"],
+    }
+
+
+def benchmark(scale, jobs=1, trace_memory=False, seed=0):
+    """Generates a tree at the given scale and converts it in a fresh process.
+
+    The process is spawned rather than forked, so it does not inherit the
+    memory of the generation of the tree.
+
+    Args:
+        scale (float): The size relative to the real catalogue.
+        jobs (int, optional): The number of HTML parsing processes. Defaults to 1.
+        trace_memory (bool, optional): See `run_stages`. Defaults to False.
+        seed (int, optional): The random seed of the tree. Defaults to 0.
+
+    Returns:
+        dict: The results of `run_stages`, with the scale and corpus counts.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "emb3d"
+        counts = generate_corpus(root, scale, seed)
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = executor.submit(
+                run_stages, root, Path(tmp) / "out_stix.json", jobs, trace_memory
+            ).result()
+    return {"scale": scale, "corpus": counts, **results}
+
+
+def print_results(results):
+    """Prints a table of stage timings, one column per scale."""
+    names = [s["stage"] for s in results[0]["stages"]]
+    header = f"{'stage':<22}" + "".join(f"{r['scale']:>11}x" for r in results)
+    print(header)
+    print("-" * len(header))
+    for i, name in enumerate(names):
+        print(
+            f"{name:<22}"
+            + "".join(f"{r['stages'][i]['seconds']:>11.3f}s" for r in results)
+        )
+        if "peak_bytes" in results[0]["stages"][i]:
+            print(
+                f"{'  peak traced (MB)':<22}"
+                + "".join(
+                    f"{r['stages'][i]['peak_bytes'] / 2**20:>12.1f}" for r in results
+                )
+            )
+    print("-" * len(header))
+    print(f"{'total':<22}" + "".join(f"{r['total_seconds']:>11.3f}s" for r in results))
+    print(
+        f"{'peak rss (MB)':<22}"
+        + "".join(f"{r['peak_rss_kb'] / 1024:>12.1f}" for r in results)
+    )
+    print(
+        f"{'  parse process (MB)':<22}"
+        + "".join(f"{r['peak_children_rss_kb'] / 1024:>12.1f}" for r in results)
+    )
+    print(f"{'objects':<22}" + "".join(f"{r['objects']:>12}" for r in results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scales",
+        type=float,
+        nargs="+",
+        default=[1, 10],
+        help="sizes relative to the real catalogue (default: 1 10)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to parse the HTML pages (default: 1)",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="measure the peak memory of each stage with tracemalloc (slower)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = [
+        benchmark(scale, args.jobs, args.trace_memory, args.seed)
+        for scale in args.scales
+    ]
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
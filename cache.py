@@ -0,0 +1,101 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from instrumentation import count
+
+# bump when the format of the extracted records changes
+CACHE_VERSION = "1"
+
+
+class BuildCache:
+    """Content-addressed on-disk cache of the records extracted from source files.
+
+    Records are keyed by the hash of the file content and of the parameters of
+    the extraction, so a file is only parsed again when it changes. Entries are
+    written atomically and can be shared by concurrent builds.
+
+    Args:
+        directory (str, optional): The cache directory. Defaults to "OUT/.cache".
+    """
+
+    def __init__(self, directory="OUT/.cache"):
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def content_key(self, content, *params):
+        """Computes the cache key of the content of a source file.
+
+        Args:
+            content (bytes): The content of the file.
+            *params: Extraction parameters that change the record.
+
+        Returns:
+            str: The hex digest identifying the record.
+        """
+        digest = hashlib.sha256(CACHE_VERSION.encode())
+        for param in params:
+            digest.update(f"\0{param}".encode())
+        digest.update(b"\0")
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.pickle"
+
+    def __contains__(self, key):
+        return self._path(key).exists()
+
+    def load(self, key):
+        """Loads a record.
+
+        Args:
+            key (str): The key returned by `content_key`.
+
+        Returns:
+            The cached record, or None when it is not cached.
+        """
+        try:
+            with open(self._path(key), "rb") as f:
+                record = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            count("cache.misses")
+            return None
+        self.hits += 1
+        count("cache.hits")
+        return record
+
+    def store(self, key, record):
+        """Stores a record.
+
+        Args:
+            key (str): The key returned by `content_key`.
+            record: The record to store.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def get_content(self, content, extract, *params):
+        """Returns the record of a file content, extracting it on a miss.
+
+        Args:
+            content (bytes): The content of the source file.
+            extract (callable): Called as extract(content, *params) on a miss.
+            *params: Extraction parameters that change the record.
+
+        Returns:
+            The record.
+        """
+        key = self.content_key(content, *params)
+        record = self.load(key)
+        if record is None:
+            record = extract(content, *params)
+            self.store(key, record)
+        return record
@@ -0,0 +1,264 @@
+from contextvars import copy_context
+from pathlib import Path
+from cache import BuildCache
+from cwe import CweIndex, enrich_weaknesses
+from instrumentation import Profiler
+from nvd import NvdIndex, enrich_cves
+from objects.category import make_emb3d_categories
+from objects.course_of_action import process_coas
+from objects.identity import make_emb3d_identity
+from objects.matrix import make_emb3d_matrix
+from objects.property import process_props
+from objects.vulnerability import inner_relationships, process_threats
+from pages import extract_html_records, html_pages, merge_html_record
+from sources import load_sources, open_source
+from utils import STABLE_TIMESTAMP, RelationshipStore, materialize
+from validation import validate_objects
+
+# mapping keys that are not copied to the objects, by mapping file
+keys_to_exclude = {
+    "mitigations": {"threats", "id", "name"},
+    "properties": {
+        "threats",
+        "id",
+        "subProps",
+        "isparentProp",
+        "parentProp",
+        "name",
+        "text",
+    },
+    "threats": {"properties", "id", "mitigations", "name"},
+}
+
+
+def make_data():
+    """
+    Creates an empty data structure.
+
+        Returns:
+            dict: The object categories, in bundle order.
+    """
+    return {
+        "identities": [],
+        "matrices": [],
+        "categories": [],
+        "mitigations": {},
+        "threats": {},
+        "properties": {},
+        "relationships": RelationshipStore(),
+        "weaknesses": {},
+    }
+
+
+class Converter:
+    """Converts an EMB3D checkout to STIX objects.
+
+    A converter owns the objects of each run, so it can be run several times,
+    or several converters can run side by side, in the same process. Nothing is
+    written to disk apart from the build cache, when one is configured; the
+    objects are returned and handed to the given sinks.
+
+    Args:
+        root (str, optional): The path of the EMB3D tree: a checkout, a .zip or
+                              .tar.gz release archive or a git repository
+                              (see `sources.open_source`). Defaults to "emb3d".
+        ref (str, optional): The ref to convert when `root` is a git
+                             repository. Defaults to None.
+        jobs (int, optional): The number of processes used to parse the HTML
+                              pages. Defaults to 1.
+        cache_dir (str, optional): The directory of the build cache, or None
+                                   to parse every file. Defaults to None.
+        html_parser (str, optional): The BeautifulSoup parser. Defaults to
+                                     "html.parser".
+        deterministic (bool, optional): Whether to derive ids and timestamps
+                                        from the source. Defaults to False.
+        similar_min_shared (int, optional): The minimum number of shared
+                                            properties of similar-to threats.
+                                            Defaults to 1.
+        similar_weights (bool, optional): Whether to store the number of shared
+                                          properties in similar-to
+                                          relationships. Defaults to False.
+        profile (bool, optional): Whether to collect the counters of the run in
+                                  `profiler`. Defaults to False.
+        cprofile (bool, optional): Whether to also run cProfile. Defaults to
+                                   False.
+        cwe_xml (str, optional): The path of a MITRE CWE XML catalogue to
+                                 enrich the weaknesses from, or None. Defaults
+                                 to None.
+        cwe_index (str, optional): The path of the index of the catalogue.
+                                   Defaults to cwe_index.sqlite in the cache
+                                   directory, or in OUT/.cache.
+        nvd_feeds (list, optional): NVD JSON feeds, or directories of them, to
+                                    enrich the CVEs from, or None. Defaults to
+                                    None.
+        nvd_index (str, optional): The path of the index of the feeds.
+                                   Defaults to nvd_index.sqlite in the cache
+                                   directory, or in OUT/.cache.
+        fast (bool, optional): Whether to skip building stix2 objects and
+                               validate the final objects in one pass instead
+                               (see `validation.validate_objects`). The objects
+                               are then plain dicts. Defaults to False.
+
+    Examples:
+        converter = Converter("emb3d", jobs=4, deterministic=True)
+        data = converter.run()
+    """
+
+    def __init__(
+        self,
+        root="emb3d",
+        ref=None,
+        jobs=1,
+        cache_dir=None,
+        html_parser="html.parser",
+        deterministic=False,
+        similar_min_shared=1,
+        similar_weights=False,
+        profile=False,
+        cprofile=False,
+        cwe_xml=None,
+        cwe_index=None,
+        nvd_feeds=None,
+        nvd_index=None,
+        fast=False,
+    ):
+        self.root = root
+        self.ref = ref
+        self.jobs = jobs
+        self.cache = None if cache_dir is None else BuildCache(cache_dir)
+        self.html_parser = html_parser
+        self.deterministic = deterministic
+        self.similar_min_shared = similar_min_shared
+        self.similar_weights = similar_weights
+        self.profile = profile or cprofile
+        self.cprofile = cprofile
+        self.cwe_xml = cwe_xml
+        self.cwe_index = cwe_index or (
+            Path(cache_dir or "OUT/.cache") / "cwe_index.sqlite"
+        )
+        self.nvd_feeds = nvd_feeds
+        self.nvd_index = nvd_index or (
+            Path(cache_dir or "OUT/.cache") / "nvd_index.sqlite"
+        )
+        self.fast = fast
+        self.data = None
+        self.profiler = None
+
+    def run(self, sinks=()):
+        """Converts the checkout.
+
+        The run has its own context, so the deterministic mode and the profiler
+        of a converter do not leak into other runs.
+
+        Args:
+            sinks (iterable, optional): Callables called in order with the data
+                                        dict once the objects are built.
+                                        Defaults to ().
+
+        Returns:
+            dict: The STIX objects, by category, in bundle order.
+        """
+        return copy_context().run(self._run, sinks)
+
+    def read_sources(self, source):
+        """Returns the parsed mapping files of a source, see `load_sources`."""
+        return load_sources(source, self.cache)
+
+    def read_pages(self, source):
+        """Returns the records of the HTML pages of a source, in page order."""
+        return extract_html_records(
+            source, html_pages(source), self.jobs, self.cache, self.html_parser
+        )
+
+    def build_objects(self, data):
+        """Replaces the drafts with their STIX objects, see `materialize`."""
+        if self.fast:
+            validate_objects(data)
+        else:
+            materialize(data)
+
+    def _run(self, sinks):
+        with open_source(self.root, self.ref) as source:
+            return self._build(source, sinks)
+
+    def _build(self, source, sinks):
+        data = self.data = make_data()
+        profiler = self.profiler = Profiler(data, cprofile=self.cprofile)
+        if self.profile:
+            profiler.activate()
+        if self.deterministic:
+            STABLE_TIMESTAMP.set(source.timestamp())
+
+        with profiler.stage("identity"):
+            data["identities"] = make_emb3d_identity()
+            identity = data["identities"][0]["id"]
+
+        with profiler.stage("load_sources"):
+            sources = self.read_sources(source)
+
+        with profiler.stage("process_coas"):
+            process_coas(
+                data,
+                sources["mitigations"],
+                identity,
+                keys_to_exclude["mitigations"],
+            )
+        with profiler.stage("process_props"):
+            process_props(
+                data,
+                sources["properties"],
+                identity,
+                keys_to_exclude["properties"],
+            )
+        with profiler.stage("process_threats"):
+            process_threats(
+                data,
+                sources["threats"],
+                identity,
+                keys_to_exclude["threats"],
+            )
+
+        with profiler.stage("categories_matrix"):
+            data["categories"] = make_emb3d_categories(
+                identity,
+                sorted(set([x["x_category"] for x in data["threats"].values()])),
+            )
+            data["matrices"] = make_emb3d_matrix(
+                [x["id"] for x in data["categories"]]
+            )
+
+        # grab descriptions and other info from html files
+        with profiler.stage("html_extraction"):
+            for record in self.read_pages(source):
+                merge_html_record(data, record)
+
+        # complete the weaknesses from the CWE catalogue
+        if self.cwe_xml:
+            with profiler.stage("cwe_enrichment"):
+                with CweIndex(self.cwe_xml, self.cwe_index) as index:
+                    enrich_weaknesses(data, index)
+
+        # complete the CVEs from the NVD feeds
+        if self.nvd_feeds:
+            with profiler.stage("cve_enrichment"):
+                with NvdIndex(self.nvd_feeds, self.nvd_index) as index:
+                    enrich_cves(data, index)
+
+        # add internal similarity relationship for vulnerability
+        with profiler.stage("inner_relationships"):
+            inner_relationships(
+                data,
+                sources["properties"],
+                min_shared=self.similar_min_shared,
+                weighted=self.similar_weights,
+            )
+
+        # build the STIX objects from the drafts
+        with profiler.stage("validate" if self.fast else "materialize"):
+            self.build_objects(data)
+
+        with profiler.stage("export"):
+            for sink in sinks:
+                sink(data)
+
+        return data
@@ -0,0 +1,267 @@
+import json
+import os
+import sqlite3
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from instrumentation import count
+from utils import update_draft
+
+# bump when the format of the indexed records changes
+INDEX_VERSION = "1"
+
+
+def local_name(tag):
+    """Returns a tag without its namespace, e.g. "Weakness" for "{...}Weakness"."""
+    return tag.rpartition("}")[2]
+
+
+def child_text(elem, name):
+    """Returns the text of the first child with a local name, or None."""
+    for child in elem:
+        if local_name(child.tag) == name:
+            return " ".join("".join(child.itertext()).split()) or None
+    return None
+
+
+def children(elem, name):
+    """Returns the grandchildren of `elem` under its child `name`.
+
+    Examples:
+        children(weakness, "Common_Consequences") -> the Consequence elements
+    """
+    for child in elem:
+        if local_name(child.tag) == name:
+            return list(child)
+    return []
+
+
+def weakness_record(elem):
+    """Extracts the fields of a Weakness element of the CWE catalogue.
+
+    Args:
+        elem (Element): The Weakness element.
+
+    Returns:
+        dict: The fields, with the ids of its references in "references".
+    """
+    consequences = []
+    for c in children(elem, "Common_Consequences"):
+        scopes = [s.text for s in c if local_name(s.tag) == "Scope" and s.text]
+        impacts = [i.text for i in c if local_name(i.tag) == "Impact" and i.text]
+        consequences.append(f"{', '.join(scopes)}: {', '.join(impacts)}")
+    detections = []
+    for d in children(elem, "Detection_Methods"):
+        method = child_text(d, "Method")
+        effectiveness = child_text(d, "Effectiveness")
+        if method:
+            detections.append(
+                f"{method} ({effectiveness})" if effectiveness else method
+            )
+    likelihood = child_text(elem, "Likelihood_Of_Exploit")
+    return {
+        "name": elem.get("Name"),
+        "description": child_text(elem, "Description"),
+        "modes_of_introduction": list(
+            dict.fromkeys(
+                p
+                for i in children(elem, "Modes_Of_Introduction")
+                if (p := child_text(i, "Phase"))
+            )
+        ),
+        "common_consequences": consequences,
+        "detection_methods": detections,
+        "likelihood_of_exploit": [likelihood] if likelihood else [],
+        "references": [
+            r.get("External_Reference_ID") for r in children(elem, "References")
+        ],
+    }
+
+
+def reference_record(elem):
+    """Extracts the title and URL of an External_Reference element."""
+    return {"title": child_text(elem, "Title"), "url": child_text(elem, "URL")}
+
+
+class CweIndex:
+    """Persistent index of a MITRE CWE XML catalogue, keyed by CWE id.
+
+    The catalogue is streamed once with iterparse, keeping one element in
+    memory at a time, into an SQLite file. The index is rebuilt only when the
+    size or modification time of the catalogue changes, and lookups read only
+    the requested entries.
+
+    Args:
+        xml_filename (str): The path of the CWE XML catalogue, e.g.
+                            cwec_v4.14.xml.
+        index_filename (str): The path of the index.
+    """
+
+    def __init__(self, xml_filename, index_filename):
+        self.xml_filename = Path(xml_filename)
+        self.index_filename = Path(index_filename)
+        self.connection = None
+
+    def _stamp(self):
+        stat = self.xml_filename.stat()
+        return f"{INDEX_VERSION} {stat.st_size} {stat.st_mtime_ns}"
+
+    def open(self):
+        """Opens the index, building it first when it is missing or stale."""
+        stamp = self._stamp()
+        if self.index_filename.exists():
+            connection = sqlite3.connect(self.index_filename)
+            try:
+                (current,) = connection.execute("SELECT stamp FROM meta").fetchone()
+            except sqlite3.Error:
+                current = None
+            if current == stamp:
+                self.connection = connection
+                return self
+            connection.close()
+        self.build(stamp)
+        self.connection = sqlite3.connect(self.index_filename)
+        return self
+
+    def build(self, stamp):
+        """Streams the catalogue into a new index.
+
+        Args:
+            stamp (str): The version of the catalogue stored in the index.
+
+        Returns:
+            int: The number of weaknesses indexed.
+        """
+        self.index_filename.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{self.index_filename}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        connection = sqlite3.connect(tmp)
+        connection.executescript(
+            """CREATE TABLE meta (stamp TEXT NOT NULL);
+CREATE TABLE weaknesses (id TEXT PRIMARY KEY, record TEXT NOT NULL);
+CREATE TABLE refs (id TEXT PRIMARY KEY, record TEXT NOT NULL);"""
+        )
+        rows = {"weaknesses": [], "refs": []}
+        indexed = 0
+
+        def flush():
+            for table, values in rows.items():
+                connection.executemany(f"INSERT INTO {table} VALUES (?, ?)", values)
+                values.clear()
+
+        with connection:
+            # the open elements, so the handled ones can be dropped from their
+            # parent: clearing them would leave an empty element per entry
+            parents = []
+            events = ET.iterparse(self.xml_filename, events=("start", "end"))
+            for event, elem in events:
+                if event == "start":
+                    parents.append(elem)
+                    continue
+                parents.pop()
+                tag = local_name(elem.tag)
+                if tag == "Weakness":
+                    record = weakness_record(elem)
+                    rows["weaknesses"].append((elem.get("ID"), json.dumps(record)))
+                    indexed += 1
+                elif tag == "External_Reference":
+                    record = reference_record(elem)
+                    rows["refs"].append((elem.get("Reference_ID"), json.dumps(record)))
+                elif tag not in ("Category", "View"):
+                    continue
+                parents[-1].remove(elem)
+                if len(rows["weaknesses"]) + len(rows["refs"]) >= 1000:
+                    flush()
+            flush()
+            connection.execute("INSERT INTO meta VALUES (?)", (stamp,))
+        connection.close()
+        os.replace(tmp, self.index_filename)
+        count("cwe.indexed", indexed)
+        return indexed
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, cwe_id):
+        """Returns the fields of a weakness.
+
+        Args:
+            cwe_id (str): The CWE id, e.g. "CWE-79" or "79".
+
+        Returns:
+            dict: The fields, with its references resolved to titles and URLs,
+                  or None when the catalogue does not have it.
+        """
+        number = cwe_id.upper().removeprefix("CWE-")
+        row = self.connection.execute(
+            "SELECT record FROM weaknesses WHERE id = ?", (number,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        refs = record.pop("references")
+        record["references"] = []
+        for ref_id in refs:
+            ref = self.connection.execute(
+                "SELECT record FROM refs WHERE id = ?", (ref_id,)
+            ).fetchone()
+            if ref is not None:
+                record["references"].append({"id": ref_id, **json.loads(ref[0])})
+        return record
+
+
+def enrich_weaknesses(data, index):
+    """Fills the weaknesses with the fields of the CWE catalogue.
+
+    Only the CWEs referenced by EMB3D are looked up. The description found in
+    EMB3D is kept when there is one.
+
+    Args:
+        data (dict): The dict containing actual objects.
+        index (CweIndex): The open index of the catalogue.
+
+    Returns:
+        None: This function updates the provided data dictionary in place
+              but does not return any value.
+    """
+    for name, draft in data["weaknesses"].items():
+        record = index.get(name)
+        if record is None:
+            count("cwe.missing")
+            continue
+        number = name.upper().removeprefix("CWE-")
+        refs = [
+            {
+                "source_name": "cwe",
+                "external_id": f"CWE-{number}",
+                "url": f"https://cwe.mitre.org/data/definitions/{number}.html",
+            }
+        ]
+        for ref in record["references"]:
+            if ref["url"] or ref["title"]:
+                refs.append(
+                    {
+                        "source_name": "cwe",
+                        "external_id": ref["id"],
+                        **({"description": ref["title"]} if ref["title"] else {}),
+                        **({"url": ref["url"]} if ref["url"] else {}),
+                    }
+                )
+        update_draft(
+            draft,
+            description=draft.get("description") or record["description"],
+            modes_of_introduction=record["modes_of_introduction"],
+            common_consequences=record["common_consequences"],
+            detection_methods=record["detection_methods"],
+            likelihood_of_exploit=record["likelihood_of_exploit"],
+            external_references=refs,
+        )
+        count("cwe.enriched")
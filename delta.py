@@ -0,0 +1,199 @@
+import json
+from datetime import datetime, timedelta, timezone
+from stix2 import parse
+from stix2.serialization import serialize
+from stix2.utils import format_datetime, parse_into_datetime
+from export import Writer, fan_out, iter_objects, write_bundle
+from utils import STABLE_TIMESTAMP
+
+# properties that change on every build and are not part of the content
+VOLATILE_KEYS = {"id", "created", "modified", "spec_version"}
+
+
+def entity_key(obj):
+    """Returns the stable key of a non-relationship object.
+
+    The key is the STIX type and the EMB3D identifier, which is the part of the
+    name before the colon (e.g. "TID-201" for "TID-201: Inadequate ...").
+
+    Args:
+        obj (dict): The STIX object.
+
+    Returns:
+        tuple: The stable key.
+    """
+    return obj["type"], obj.get("name", "").split(":")[0]
+
+
+def index_objects(objects):
+    """Indexes STIX objects by stable key.
+
+    Relationships are keyed by the keys of their endpoints and their type, so
+    objects can be matched across bundles with different ids.
+
+    Args:
+        objects (list): The STIX objects, as dicts.
+
+    Returns:
+        tuple: The objects by stable key and the stable keys by id.
+    """
+    by_key, keys = {}, {}
+    for obj in objects:
+        if obj["type"] != "relationship":
+            keys[obj["id"]] = entity_key(obj)
+    for obj in objects:
+        if obj["type"] == "relationship":
+            key = (
+                "relationship",
+                keys.get(obj["source_ref"], obj["source_ref"]),
+                obj["relationship_type"],
+                keys.get(obj["target_ref"], obj["target_ref"]),
+            )
+        else:
+            key = keys[obj["id"]]
+        by_key.setdefault(key, obj)
+    return by_key, keys
+
+
+def _map_refs(obj, ids):
+    """Returns a copy of an object with its references replaced via `ids`."""
+    tmp = {}
+    for k, v in obj.items():
+        if k.endswith("_ref"):
+            v = ids.get(v, v)
+        elif k.endswith("_refs"):
+            v = [ids.get(x, x) for x in v]
+        tmp[k] = v
+    return tmp
+
+
+def _content(obj, keys):
+    """Returns the comparable content of an object, without ids and timestamps."""
+    tmp = _map_refs(obj, keys)
+    return {k: v for k, v in tmp.items() if k not in VOLATILE_KEYS}
+
+
+def _bump(modified):
+    """Returns a modified timestamp later than `modified`."""
+    timestamp = STABLE_TIMESTAMP.get() or datetime.now(tz=timezone.utc)
+    previous = parse_into_datetime(modified, precision="millisecond")
+    if timestamp <= previous:
+        timestamp = previous + timedelta(milliseconds=1)
+    return format_datetime(timestamp)
+
+
+def make_delta(data, previous):
+    """Computes the objects that changed since a previous bundle.
+
+    Objects are matched by stable key (see `index_objects`). New objects are
+    returned as they are, changed objects are returned as a new version of the
+    previous object (same id and created, later modified) and objects missing
+    from `data` are returned revoked. References are rewritten to the ids of the
+    previous bundle, so the delta can be applied on top of it.
+
+    Args:
+        data (dict): The dict containing actual objects.
+        previous (list): The objects of the previous bundle, as dicts.
+
+    Returns:
+        dict: The new, changed and revoked STIX objects, by category.
+    """
+    current = [json.loads(serialize(obj)) for obj in iter_objects(data)]
+    return diff_objects(current, previous)
+
+
+def diff_objects(current, previous):
+    """Computes the delta between two lists of objects, see `make_delta`.
+
+    Args:
+        current (list): The objects of the current build, as dicts.
+        previous (list): The objects of the previous bundle, as dicts.
+
+    Returns:
+        dict: The new, changed and revoked STIX objects, by category.
+    """
+    old_by_key, old_keys = index_objects(
+        [obj for obj in previous if not obj.get("revoked")]
+    )
+    new_by_key, new_keys = index_objects(current)
+
+    # ids of the current objects that already exist in the previous bundle
+    ids = {
+        obj_id: old_by_key[key]["id"]
+        for obj_id, key in new_keys.items()
+        if key in old_by_key
+    }
+    for key, obj in new_by_key.items():
+        if key[0] == "relationship" and key in old_by_key:
+            ids[obj["id"]] = old_by_key[key]["id"]
+
+    delta = {"new": [], "changed": [], "revoked": []}
+    for key, obj in new_by_key.items():
+        old = old_by_key.get(key)
+        if old is None:
+            delta["new"].append(parse(_map_refs(obj, ids), allow_custom=True))
+        elif _content(obj, new_keys) != _content(old, old_keys):
+            obj = _map_refs(obj, ids)
+            obj.update(
+                id=old["id"], created=old["created"], modified=_bump(old["modified"])
+            )
+            delta["changed"].append(parse(obj, allow_custom=True))
+    for key, old in old_by_key.items():
+        if key not in new_by_key:
+            old = dict(old, revoked=True, modified=_bump(old["modified"]))
+            delta["revoked"].append(parse(old, allow_custom=True))
+    return delta
+
+
+class DeltaWriter(Writer):
+    """Writes a bundle with the objects that changed since a previous bundle.
+
+    The previous bundle is read when the writer is opened, so it can be the
+    bundle being overwritten by the same export.
+
+    Args:
+        previous_filename (str): The path of the previous bundle.
+        filename (str): The path of the delta bundle.
+        indent (int, optional): The indentation of the JSON output, or None for
+                                compact output. Defaults to 4.
+    """
+
+    def __init__(self, previous_filename, filename, indent=4):
+        self.previous_filename = previous_filename
+        self.filename = filename
+        self.indent = indent
+        self.previous = None
+        self.current = []
+
+    def open(self):
+        with open(self.previous_filename) as f:
+            self.previous = json.load(f)["objects"]
+
+    def write(self, obj):
+        self.current.append(json.loads(serialize(obj)))
+
+    def close(self):
+        delta = diff_objects(self.current, self.previous)
+        write_bundle(delta, self.filename, self.indent)
+        return {k: len(v) for k, v in delta.items()}
+
+
+def write_delta(data, previous_filename, filename, indent=4):
+    """Writes a bundle with the objects that changed since a previous bundle.
+
+    See `DeltaWriter`.
+
+    Args:
+        data (dict): The dict containing actual objects.
+        previous_filename (str): The path of the previous bundle.
+        filename (str): The path of the delta bundle.
+        indent (int, optional): The indentation of the JSON output, or None for
+                                compact output. Defaults to 4.
+
+    Returns:
+        dict: The number of new, changed and revoked objects.
+
+    Examples:
+        write_delta(data, "OUT/previous_stix.json", "OUT/delta_stix.json")
+    """
+    return fan_out(data, [DeltaWriter(previous_filename, filename, indent)])[0]
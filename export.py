@@ -0,0 +1,205 @@
+import os
+from abc import ABC, abstractmethod
+from stix2.serialization import serialize
+from utils import STABLE_TIMESTAMP, make_id
+
+
+def iter_objects(data):
+    """Yields every STIX object of the data structure.
+
+    Objects are yielded category by category, in the order of the data
+    dictionary, so the output is the same as building a bundle from the
+    concatenated categories.
+
+    Args:
+        data (dict): The dict containing actual objects.
+
+    Yields:
+        The STIX objects, as stix2 objects or, in fast mode, plain dicts.
+    """
+    for objs in data.values():
+        try:
+            yield from objs.values()
+        except AttributeError:
+            yield from objs
+
+
+class Writer(ABC):
+    """An output fed one object at a time by `fan_out`.
+
+    `open` is called before the first object, `write` for every object and
+    `close` after the last one, and returns the summary of the output. `abort`
+    is called instead of `close` when the export fails. Subclasses must
+    implement `write`.
+    """
+
+    def open(self):
+        pass
+
+    @abstractmethod
+    def write(self, obj):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class FileWriter(Writer):
+    """A writer of a file, written next to its target and moved over it once
+    complete, so readers never see a partial file.
+
+    Args:
+        filename (str): The path of the file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tmp = f"{filename}.tmp"
+        self.file = None
+
+    def open(self):
+        self.file = open(self.tmp, "w", newline="")
+
+    def close(self):
+        self.file.close()
+        os.replace(self.tmp, self.filename)
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+class BundleWriter(FileWriter):
+    """Writes a STIX bundle, one object at a time.
+
+    The bundle envelope is written first and every object is serialized and
+    written on its own, so the whole bundle is never held in memory.
+
+    Args:
+        filename (str): The path of the bundle file.
+        indent (int, optional): The indentation of the JSON output, or None for
+                                compact output. Defaults to 4.
+    """
+
+    def __init__(self, filename, indent=4):
+        super().__init__(filename)
+        self.indent = indent
+        self.count = 0
+
+    def open(self):
+        super().open()
+        bundle_id = make_id("bundle", f"EMB3D {STABLE_TIMESTAMP.get()}")
+        if self.indent is None:
+            self.file.write(f'{{"type":"bundle","id":"{bundle_id}","objects":[')
+        else:
+            pad = " " * self.indent
+            self.file.write(f'{{\n{pad}"type": "bundle",\n{pad}"id": "{bundle_id}",\n')
+            self.file.write(f'{pad}"objects": [')
+
+    def text(self, obj):
+        """Returns an object serialized as it is written in the bundle."""
+        if self.indent is None:
+            return serialize(obj, separators=(",", ":"))
+        pad = " " * self.indent
+        return serialize(obj, indent=self.indent).replace("\n", "\n" + pad * 2)
+
+    def write(self, obj):
+        text = self.text(obj)
+        if self.indent is None:
+            self.file.write(f"{',' if self.count else ''}{text}")
+        else:
+            pad = " " * self.indent
+            self.file.write(f"{',' if self.count else ''}\n{pad * 2}{text}")
+        self.count += 1
+
+    def close(self):
+        if self.indent is None:
+            self.file.write("]}")
+        else:
+            pad = " " * self.indent
+            self.file.write(f"\n{pad}]\n}}" if self.count else "]\n}")
+        super().close()
+        return self.count
+
+
+class JsonLinesWriter(FileWriter):
+    """Writes one compact STIX object per line.
+
+    Args:
+        filename (str): The path of the JSON Lines file.
+    """
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.count = 0
+
+    def write(self, obj):
+        self.file.write(serialize(obj, separators=(",", ":")))
+        self.file.write("\n")
+        self.count += 1
+
+    def close(self):
+        super().close()
+        return self.count
+
+
+def fan_out(data, writers):
+    """Streams the objects of the data structure to several writers at once.
+
+    The objects are traversed, and relationships expanded, a single time
+    whatever the number of outputs. If any writer fails, or two objects have
+    the same id, every output is aborted.
+
+    Args:
+        data (dict): The dict containing actual objects.
+        writers (list): The `Writer` objects.
+
+    Returns:
+        list: The summary returned by each writer, in order.
+
+    Raises:
+        ValueError: If two objects have the same id.
+
+    Examples:
+        fan_out(data, [BundleWriter("OUT/out_stix.json"), JsonLinesWriter("out.jsonl")])
+    """
+    try:
+        for writer in writers:
+            writer.open()
+        ids = set()
+        for obj in iter_objects(data):
+            if obj["id"] in ids:
+                raise ValueError(f"duplicate STIX id {obj['id']}")
+            ids.add(obj["id"])
+            for writer in writers:
+                writer.write(obj)
+        return [writer.close() for writer in writers]
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+
+
+def write_bundle(data, filename, indent=4):
+    """Writes the data structure to a STIX bundle file, one object at a time.
+
+    See `BundleWriter`.
+
+    Args:
+        data (dict): The dict containing actual objects.
+        filename (str): The path of the bundle file.
+        indent (int, optional): The indentation of the JSON output, or None for
+                                compact output. Defaults to 4.
+
+    Returns:
+        int: The number of objects written.
+
+    Examples:
+        write_bundle(data, "OUT/out_stix.json", indent=None)
+    """
+    return fan_out(data, [BundleWriter(filename, indent)])[0]
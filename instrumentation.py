@@ -0,0 +1,114 @@
+import cProfile
+import json
+import resource
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# profiler collecting the counters of the current build, None when disabled
+PROFILER = ContextVar("profiler", default=None)
+
+
+def count(name, n=1):
+    """Increments a counter of the active profiler, if any.
+
+    Args:
+        name (str): The name of the counter, e.g. "relationships.created".
+        n (int, optional): The increment. Defaults to 1.
+    """
+    profiler = PROFILER.get()
+    if profiler is not None:
+        profiler.counters[name] += n
+
+
+class Profiler:
+    """Records the wall time, object counts and counters of each build stage.
+
+    Counters are collected through `count` while the profiler is active (see
+    `activate`). When tracemalloc is tracing, the peak memory allocated by each
+    stage is recorded too. The report is a JSON document meant for build
+    dashboards.
+
+    Args:
+        data (dict): The dict containing actual objects, whose sizes are
+                     recorded at the end of each stage.
+        cprofile (bool, optional): Whether to also run cProfile over the
+                                   stages. Defaults to False.
+    """
+
+    def __init__(self, data, cprofile=False):
+        self.data = data
+        self.counters = Counter()
+        self.stages = []
+        self.started = datetime.now(tz=timezone.utc)
+        self.cprofile = cProfile.Profile() if cprofile else None
+
+    def activate(self):
+        """Makes this profiler collect the counters of the current context."""
+        PROFILER.set(self)
+
+    @contextmanager
+    def stage(self, name):
+        """Times a stage of the build.
+
+        Args:
+            name (str): The name of the stage.
+
+        Examples:
+            with profiler.stage("process_coas"):
+                process_coas(data, sources["mitigations"], identity)
+        """
+        counters = self.counters.copy()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if self.cprofile is not None:
+                self.cprofile.disable()
+            stage = {
+                "stage": name,
+                "seconds": round(seconds, 6),
+                "objects": {k: len(v) for k, v in self.data.items()},
+                "counters": dict(self.counters - counters),
+            }
+            if tracemalloc.is_tracing():
+                stage["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            self.stages.append(stage)
+
+    def report(self):
+        """Returns the report of the build.
+
+        Returns:
+            dict: The stages in order, the total counters and the peak memory.
+        """
+        return {
+            "started": self.started.isoformat(),
+            "total_seconds": round(sum(s["seconds"] for s in self.stages), 6),
+            # kilobytes on Linux
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "objects": {k: len(v) for k, v in self.data.items()},
+            "counters": dict(sorted(self.counters.items())),
+            "stages": self.stages,
+        }
+
+    def write(self, filename, cprofile_filename=None):
+        """Writes the report, and the cProfile statistics when enabled.
+
+        Args:
+            filename (str): The path of the JSON report.
+            cprofile_filename (str, optional): The path of the cProfile dump,
+                                               readable with pstats. Defaults
+                                               to None.
+        """
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=4)
+        if self.cprofile is not None and cprofile_filename:
+            self.cprofile.dump_stats(cprofile_filename)
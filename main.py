@@ -1,205 +1,308 @@
-import re
-import uuid
-from bs4 import BeautifulSoup
-from objects.identity import make_emb3d_identity
-from objects.matrix import make_emb3d_matrix
-from objects.category import make_emb3d_categories
-from objects.property import process_props
-from objects.weakness import Weakness
-from objects.course_of_action import process_coas
-from objects.vulnerability import inner_relationships, process_threats
+import argparse
+import sys
+from functools import partial
 from pathlib import Path
-from utils import create_relationship
-from stix2 import (
-    Vulnerability,
-    Bundle,
-    ExternalReference,
-)
-from stix2.v21.common import ExternalReference
-
-
-objects_info = {
-    "threats": {
-        "code": "TID",
-        "key": "threattitle",
-        "query": "article div > *:not(div, h1, h2)",
-    },
-    "mitigations": {
-        "code": "MID",
-        "key": "mitigationTitle",
-        "query": "article > *:not(div, h1, h2)",
-    },
-}
-
-data = {
-    "identities": [],
-    "matrices": [],
-    "categories": [],
-    "mitigations": {},
-    "threats": {},
-    "properties": {},
-    "relationships": [],
-    "weaknesses": {},
-}
-
-
-def extract_html_data(item, obj_type):
-    """
-    Extracts data from an HTML file and updates a data structure.
-
-        This function reads an HTML file, parses it to extract relevant information,
-        and updates a global data structure with the extracted data. It processes
-        various sections of the HTML document, including titles, descriptions,
-        references, and relationships, based on the specified object type.
-
-        Args:
-            item (str): The path to the HTML file to be processed.
-            obj_type (str): The type of object being processed, which determines
-                            how the extracted data is structured and stored.
-
-        Returns:
-            None: This function updates a global data structure but does not return
-                any value.
-
-        Raises:
-            FileNotFoundError: If the specified HTML file does not exist.
-            ValueError: If the HTML structure does not match expected formats.
-
-        Examples:
-            extract_html_data("path/to/file.html", "some_object_type")
-    """
-
-    def update_data(obj_tag, key, value):
-        match key:
-            case "title":
-                return data[obj_type][obj_tag].new_version(name=value)
-            case "description" | "threat description":
-                return data[obj_type][obj_tag].new_version(description="".join(value))
-            case "iec 62443 4-2 mappings":
-                return data[obj_type][obj_tag].new_version(x_iec_62443=value)
-            case "threat maturity and evidence":
-                return data[obj_type][obj_tag].new_version(x_maturity=value)
-            case "references":
-                refs = [
-                    ExternalReference(
-                        source_name="mitre", description=ref, url=url["url"]
-                    )
-                    for ref in value
-                    if (url := re.search(r"(?P<url>https?://[^\s]+)", ref))
-                ]
-                return data[obj_type][obj_tag].new_version(external_references=refs)
-            case _:
-                return data[obj_type][obj_tag].new_version(**{key: value})
-
-    with open(item, "r") as f:
-        soup = BeautifulSoup(f.read(), "html.parser")
-        article = soup.find("article")
-        title = " ".join(article.find("h1").text.split())
-        obj = {"title": title}
-        obj_tag = soup.find("div", {"id": objects_info[obj_type]["key"]}).text
-        obj_query = objects_info[obj_type]["query"]
-
-        for tag in article.select(obj_query):
-            prev_h2 = tag.find_previous("h2")
-            title = prev_h2.text.lower() if prev_h2 else ""
-            text = tag.get_text(strip=True, separator="\n")
-            obj.setdefault(title, []).append(" ".join(text.split()))
-
-        for key, value in obj.items():
-            if key in ["cwe", "cve"]:
-                for item in value:
-                    if key == "cwe":
-                        name, *description = item.split(":")
-                        try:
-                            from_id = data["weaknesses"][name].id
-                        except KeyError:
-                            description = " ".join(description).strip()
-                            from_id = f"weakness--{uuid.uuid4()}"
-                            data["weaknesses"][name] = Weakness(
-                                id=from_id,
-                                name=name,
-                                description=description,
-                            )
-                    elif key == "cve":
-                        try:
-                            name = [x for x in item.split() if x.startswith("CVE-")][0]
-                        except Exception:
-                            continue
-                        try:
-                            from_id = data["threats"][name].id
-                        except KeyError:
-                            from_id = f"vulnerability--{uuid.uuid4()}"
-                            data["threats"][name] = Vulnerability(
-                                id=from_id,
-                                name=name,
-                                description=item,
-                            )
-                    data["relationships"].append(
-                        create_relationship(
-                            from_id,
-                            data[obj_type][obj_tag].id,
-                            "related-to",
-                        )
-                    )
-            else:
-                data[obj_type][obj_tag] = update_data(obj_tag, key, value)
+from converter import Converter
+from delta import DeltaWriter
+from export import BundleWriter, JsonLinesWriter, fan_out
+from reports import MatrixCsvWriter, NavigatorWriter
+from revisions import build_revisions
+from shards import ShardWriter
+from sqlite import SqliteWriter
+from watch import Watcher
 
 
 # sourcery skip: collection-builtin-to-comprehension, comprehension-to-generator
 if __name__ == "__main__":
-
-    data["identities"] = make_emb3d_identity()
-    identity = data["identities"][0]["id"]
-
-    process_coas(
-        data,
-        "emb3d/_data/mitigations_threat_mappings.json",
-        identity,
-        {"threats", "id", "name"},
-    )
-    process_props(
-        data,
-        "emb3d/_data/properties_threat_mappings.json",
-        identity,
-        {"threats", "id", "subProps", "isparentProp", "parentProp", "name", "text"},
-    )
-    process_threats(
-        data,
-        "emb3d/_data/threats_properties_mitigations_mappings.json",
-        identity,
-        {"properties", "id", "mitigations", "name"},
+    parser = argparse.ArgumentParser(description="Convert EMB3D data to STIX.")
+    parser.add_argument(
+        "--source",
+        default="emb3d",
+        metavar="PATH",
+        help="EMB3D checkout, .zip or .tar.gz release archive, or git repository "
+        "(default: emb3d)",
     )
-
-    data["categories"] = make_emb3d_categories(
-        identity,
-        list(set([x["x_category"] for x in data["threats"].values()])),
+    parser.add_argument(
+        "--ref",
+        help="branch, tag or commit to convert when the source is a git repository "
+        "(default: the checkout, or HEAD of a bare repository)",
     )
-    data["matrices"] = make_emb3d_matrix([x["id"] for x in data["categories"]])
-
-    # grab descriptions and other info from html files
-    for item in Path(".").glob("emb3d/**/*.html"):
-        if (
-            item.parent.stem in objects_info
-            and item.stem[:3] == objects_info[item.parent.stem]["code"]
-        ):
-            extract_html_data(item, item.parent.stem)
-
-    # add internal similarity relationship for vulnerability
-    inner_relationships(data, "emb3d/_data/properties_threat_mappings.json")
+    parser.add_argument(
+        "--revisions",
+        nargs="+",
+        metavar="[NAME=]PATH[@REF]",
+        help="build the bundles of several sources or git refs concurrently, "
+        "to OUT/<NAME>/out_stix.json, sharing the build cache",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="rebuild OUT/out_stix.json whenever a file of the source directory "
+        "changes, until interrupted",
+    )
+    parser.add_argument(
+        "--watch-delta",
+        action="store_true",
+        help="with --watch, also write the changes of each rebuild to the --delta "
+        "bundle",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to parse the HTML pages (default: 1)",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="write the bundle without indentation",
+    )
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="derive ids and timestamps from the EMB3D source, for stable output",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="OUT/.cache",
+        help="directory of the build cache (default: OUT/.cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="parse every source file again instead of using the build cache",
+    )
+    parser.add_argument(
+        "--previous",
+        metavar="BUNDLE",
+        help="previous bundle to compare with, to also write a delta bundle",
+    )
+    parser.add_argument(
+        "--delta",
+        default="OUT/delta_stix.json",
+        help="path of the delta bundle (default: OUT/delta_stix.json)",
+    )
+    parser.add_argument(
+        "--similar-min-shared",
+        type=int,
+        default=1,
+        metavar="N",
+        help="minimum number of shared properties for similar-to threats (default: 1)",
+    )
+    parser.add_argument(
+        "--similar-weights",
+        action="store_true",
+        help="store the number of shared properties in similar-to relationships",
+    )
+    parser.add_argument(
+        "--html-parser",
+        default="html.parser",
+        help="BeautifulSoup parser for the HTML pages, e.g. lxml when installed "
+        "(default: html.parser)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="write stage timings and counters to OUT/out_stix.profile.json",
+    )
+    parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="like --profile, and also dump cProfile statistics to OUT/out_stix.prof",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="build plain objects and validate them in a single pass at the end",
+    )
+    parser.add_argument(
+        "--cwe-xml",
+        metavar="FILE",
+        help="MITRE CWE XML catalogue to complete the weaknesses from",
+    )
+    parser.add_argument(
+        "--cwe-index",
+        metavar="FILE",
+        help="index of the CWE catalogue, built on first use "
+        "(default: cwe_index.sqlite in the cache directory)",
+    )
+    parser.add_argument(
+        "--nvd-feeds",
+        nargs="+",
+        metavar="PATH",
+        help="NVD JSON feeds (.json or .json.gz), or directories of them, "
+        "to complete the CVEs from",
+    )
+    parser.add_argument(
+        "--nvd-index",
+        metavar="FILE",
+        help="index of the NVD feeds, updated when they change "
+        "(default: nvd_index.sqlite in the cache directory)",
+    )
+    parser.add_argument(
+        "--sqlite",
+        nargs="?",
+        const="OUT/out_stix.sqlite",
+        metavar="FILE",
+        help="also write an indexed SQLite database (default: OUT/out_stix.sqlite)",
+    )
+    parser.add_argument(
+        "--jsonl",
+        nargs="?",
+        const="OUT/out_stix.jsonl",
+        metavar="FILE",
+        help="also write one object per line (default: OUT/out_stix.jsonl)",
+    )
+    parser.add_argument(
+        "--csv",
+        nargs="?",
+        const="OUT/threats_mitigations.csv",
+        metavar="FILE",
+        help="also write a CSV matrix of threats by mitigations "
+        "(default: OUT/threats_mitigations.csv)",
+    )
+    parser.add_argument(
+        "--navigator",
+        nargs="?",
+        const="OUT/navigator",
+        metavar="DIR",
+        help="also write an ATT&CK Navigator layer per category "
+        "(default: OUT/navigator)",
+    )
+    parser.add_argument(
+        "--shards",
+        nargs="?",
+        const="OUT/shards",
+        metavar="DIR",
+        help="also write the objects as several bundles with a manifest "
+        "(default: OUT/shards)",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=["type", "category"],
+        default="type",
+        help="group the shards by STIX type or by EMB3D category (default: type)",
+    )
+    parser.add_argument(
+        "--shard-max-bytes",
+        type=int,
+        metavar="N",
+        help="maximum size of a shard in bytes",
+    )
+    parser.add_argument(
+        "--shard-max-objects",
+        type=int,
+        metavar="N",
+        help="maximum number of objects of a shard",
+    )
+    args = parser.parse_args()
 
-    # generate list of items
-    stix_objects = []
-    for obj_type in data:
+    indent = None if args.compact else 4
+    if args.revisions:
+        summaries = build_revisions(
+            args.revisions,
+            "OUT",
+            args.jobs,
+            None if args.no_cache else args.cache_dir,
+            indent,
+            html_parser=args.html_parser,
+            deterministic=args.deterministic,
+            similar_min_shared=args.similar_min_shared,
+            similar_weights=args.similar_weights,
+            cwe_xml=args.cwe_xml,
+            cwe_index=args.cwe_index,
+            nvd_feeds=args.nvd_feeds,
+            nvd_index=args.nvd_index,
+            fast=args.fast,
+        )
+        for summary in summaries:
+            print(
+                f"{summary['name']}: {summary['objects']} objects in "
+                f"{summary['bundle']} ({summary['seconds']}s)"
+            )
+        parser.exit()
+    if args.watch:
+        if args.ref is not None or not Path(args.source).is_dir():
+            parser.error("--watch needs a source directory")
+        watcher = Watcher(
+            args.source,
+            "OUT/out_stix.json",
+            args.delta if args.watch_delta else None,
+            indent,
+            deterministic=args.deterministic,
+            jobs=args.jobs,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            html_parser=args.html_parser,
+            similar_min_shared=args.similar_min_shared,
+            similar_weights=args.similar_weights,
+            cwe_xml=args.cwe_xml,
+            cwe_index=args.cwe_index,
+            nvd_feeds=args.nvd_feeds,
+            nvd_index=args.nvd_index,
+        )
+        print(f"watching {args.source}, press Ctrl-C to stop")
         try:
-            stix_objects.extend(data[obj_type].values())
-        except AttributeError:
-            stix_objects.extend(data[obj_type])
+            watcher.watch(
+                lambda changes, seconds: print(
+                    f"rebuilt in {seconds:.2f}s: {changes['new']} new, "
+                    f"{changes['changed']} changed, {changes['revoked']} revoked"
+                ),
+                error_callback=lambda e: print(
+                    f"rebuild failed, keeping the previous bundle: {e!r}",
+                    file=sys.stderr,
+                ),
+            )
+        except KeyboardInterrupt:
+            pass
+        parser.exit()
 
-    # remove text field
-    stix_objects = [item.new_version(text=None) for item in stix_objects]
+    # every output is fed in a single pass over the objects
+    writers = []
+    # compare with the previous bundle before it is overwritten
+    if args.previous:
+        writers.append(DeltaWriter(args.previous, args.delta, indent))
+    writers.append(BundleWriter("OUT/out_stix.json", indent))
+    if args.sqlite:
+        writers.append(SqliteWriter(args.sqlite))
+    if args.jsonl:
+        writers.append(JsonLinesWriter(args.jsonl))
+    if args.csv:
+        writers.append(MatrixCsvWriter(args.csv))
+    if args.navigator:
+        writers.append(NavigatorWriter(args.navigator))
+    if args.shards:
+        writers.append(
+            ShardWriter(
+                args.shards,
+                args.shard_by,
+                args.shard_max_bytes,
+                args.shard_max_objects,
+                args.jobs,
+            )
+        )
 
-    # create bundle
-    bundle = Bundle(stix_objects, allow_custom=True)
+    converter = Converter(
+        args.source,
+        ref=args.ref,
+        jobs=args.jobs,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        html_parser=args.html_parser,
+        deterministic=args.deterministic,
+        similar_min_shared=args.similar_min_shared,
+        similar_weights=args.similar_weights,
+        profile=args.profile,
+        cprofile=args.cprofile,
+        cwe_xml=args.cwe_xml,
+        cwe_index=args.cwe_index,
+        nvd_feeds=args.nvd_feeds,
+        nvd_index=args.nvd_index,
+        fast=args.fast,
+    )
+    converter.run([partial(fan_out, writers=writers)])
 
-    with open("OUT/out_stix.json", "w") as g:
-        g.write(bundle.serialize(indent=4))
+    if converter.profile:
+        converter.profiler.write(
+            "OUT/out_stix.profile.json",
+            "OUT/out_stix.prof" if args.cprofile else None,
+        )
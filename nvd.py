@@ -0,0 +1,368 @@
+import gzip
+import json
+import os
+import re
+import sqlite3
+from pathlib import Path
+from instrumentation import count
+from utils import update_draft
+
+# bump when the format of the indexed records changes
+INDEX_VERSION = "1"
+
+# start of the list of CVEs in the 1.1 feeds and in the 2.0 API files
+ITEMS_START = re.compile(r'"(?:CVE_Items|vulnerabilities)"\s*:\s*\[')
+
+# CVSS metrics of the 2.0 format, by preference
+CVSS_METRICS = ["cvssMetricV40", "cvssMetricV31", "cvssMetricV30", "cvssMetricV2"]
+
+
+def feed_files(paths):
+    """Lists the NVD feed files of a list of files and directories.
+
+    Args:
+        paths (list): Feed files (.json or .json.gz) and directories of them.
+
+    Returns:
+        list: The feed files, sorted by path.
+    """
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(path.glob("*.json"))
+            files.extend(path.glob("*.json.gz"))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def iter_feed_items(filename, chunk_size=1 << 16):
+    """Yields the CVE items of an NVD feed, one at a time.
+
+    The feed is read in chunks and each item is decoded as soon as it is
+    complete, so a feed is never loaded whole.
+
+    Args:
+        filename (Path): The path of the feed, gzipped when it ends in .gz.
+        chunk_size (int, optional): The number of characters read at a time.
+                                    Defaults to 64k.
+
+    Yields:
+        dict: The items of the CVE_Items (1.1 feeds) or vulnerabilities (2.0)
+              list.
+    """
+    decoder = json.JSONDecoder()
+    opener = gzip.open if str(filename).endswith(".gz") else open
+    with opener(filename, "rt", encoding="utf-8") as f:
+        buffer = ""
+        while (match := ITEMS_START.search(buffer)) is None:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            # keep the end of the buffer, which may hold part of the key
+            buffer = buffer[-32:] + chunk
+        position = match.end()
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if buffer.startswith("]", position):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield item
+            position = end
+
+
+def cve_record(item):
+    """Extracts the fields of a CVE item of a 1.1 feed or of the 2.0 API.
+
+    Args:
+        item (dict): The item.
+
+    Returns:
+        dict: The id, CVSS metric, CWE ids, references and last modification
+              date of the CVE.
+    """
+    cve = item["cve"]
+    if "CVE_data_meta" in cve:
+        impact = item.get("impact", {})
+        if "baseMetricV3" in impact:
+            data = impact["baseMetricV3"]["cvssV3"]
+            severity = data.get("baseSeverity")
+        elif "baseMetricV2" in impact:
+            data = impact["baseMetricV2"]["cvssV2"]
+            severity = impact["baseMetricV2"].get("severity")
+        else:
+            data = None
+        cwes = [
+            d["value"]
+            for p in cve.get("problemtype", {}).get("problemtype_data", [])
+            for d in p.get("description", [])
+        ]
+        references = [
+            {"url": r["url"], "source": r.get("refsource")}
+            for r in cve.get("references", {}).get("reference_data", [])
+        ]
+        cve_id, modified = cve["CVE_data_meta"]["ID"], item.get("lastModifiedDate")
+    else:
+        data = None
+        for name in CVSS_METRICS:
+            metrics = cve.get("metrics", {}).get(name)
+            if metrics:
+                metric = next(
+                    (m for m in metrics if m.get("type") == "Primary"), metrics[0]
+                )
+                data = metric["cvssData"]
+                severity = data.get("baseSeverity", metric.get("baseSeverity"))
+                break
+        cwes = [
+            d["value"] for w in cve.get("weaknesses", []) for d in w["description"]
+        ]
+        references = [
+            {"url": r["url"], "source": r.get("source")}
+            for r in cve.get("references", [])
+        ]
+        cve_id, modified = cve["id"], cve.get("lastModified")
+    cvss = None
+    if data is not None:
+        cvss = {
+            "version": data.get("version"),
+            "vector": data.get("vectorString"),
+            "score": data.get("baseScore"),
+            "severity": severity,
+        }
+    return {
+        "id": cve_id,
+        "cvss": cvss,
+        "cwes": [c for c in dict.fromkeys(cwes) if c.startswith("CWE-")],
+        "references": references,
+        "last_modified": modified or "",
+    }
+
+
+class NvdIndex:
+    """Persistent index of a local mirror of NVD JSON feeds.
+
+    The fields used by the enrichment are extracted from each feed while it
+    is streamed and appended to a records file; an SQLite index maps each CVE
+    id to the offset and length of its record. Each feed is indexed again only
+    when its size or modification time changes, so adding a feed to the mirror
+    only streams that feed. When a CVE is in several feeds, e.g. in a yearly
+    and in the "modified" feed, the most recently modified record is used.
+
+    Args:
+        feeds (list): The feed files and directories of the mirror.
+        index_filename (str): The path of the index. The records are stored
+                              next to it, with the .records suffix.
+    """
+
+    def __init__(self, feeds, index_filename):
+        self.feeds = feed_files(feeds)
+        self.index_filename = Path(index_filename)
+        self.records_filename = self.index_filename.with_suffix(".records")
+        self.connection = None
+        self.records = None
+
+    def open(self):
+        """Opens the index, indexing the new or changed feeds first."""
+        self.index_filename.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.index_filename)
+        self.connection.executescript(
+            """CREATE TABLE IF NOT EXISTS feeds (
+    number INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    stamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT NOT NULL,
+    feed INTEGER NOT NULL,
+    last_modified TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (id, feed)
+) WITHOUT ROWID;"""
+        )
+        self.update()
+        self.records = open(self.records_filename, "rb")
+        return self
+
+    def update(self):
+        """Indexes the feeds that are new or changed since the last update.
+
+        Returns:
+            int: The number of records indexed.
+        """
+        stamps = {
+            str(feed): (
+                f"{INDEX_VERSION} {feed.stat().st_size} {feed.stat().st_mtime_ns}"
+            )
+            for feed in self.feeds
+        }
+        indexed = 0
+        with self.connection:
+            # the records were removed, index every feed again
+            if not self.records_filename.exists():
+                self.connection.execute("DELETE FROM records")
+                self.connection.execute("DELETE FROM feeds")
+        known = dict(self.connection.execute("SELECT name, stamp FROM feeds"))
+        with self.connection, open(self.records_filename, "ab") as records:
+            for name in known.keys() - stamps.keys():
+                self._forget(name)
+            for name, stamp in stamps.items():
+                if known.get(name) == stamp:
+                    continue
+                self._forget(name)
+                feed = self.connection.execute(
+                    "INSERT INTO feeds (name, stamp) VALUES (?, ?)", (name, stamp)
+                ).lastrowid
+                rows = []
+                for item in iter_feed_items(name):
+                    record = cve_record(item)
+                    line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+                    rows.append(
+                        (
+                            record["id"],
+                            feed,
+                            record["last_modified"],
+                            records.tell(),
+                            len(line),
+                        )
+                    )
+                    records.write(line)
+                    if len(rows) >= 1000:
+                        indexed += self._insert(rows)
+                indexed += self._insert(rows)
+                count("nvd.feeds_indexed")
+        self._compact()
+        return indexed
+
+    def _insert(self, rows):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)", rows
+        )
+        count("nvd.records_indexed", len(rows))
+        inserted = len(rows)
+        rows.clear()
+        return inserted
+
+    def _forget(self, name):
+        self.connection.execute(
+            "DELETE FROM records WHERE feed IN"
+            " (SELECT number FROM feeds WHERE name = ?)",
+            (name,),
+        )
+        self.connection.execute("DELETE FROM feeds WHERE name = ?", (name,))
+
+    def _compact(self):
+        """Rewrites the records file when most of it belongs to old feeds."""
+        (live,) = self.connection.execute(
+            "SELECT coalesce(sum(length), 0) FROM records"
+        ).fetchone()
+        if self.records_filename.stat().st_size <= 2 * live + (1 << 20):
+            return
+        tmp = f"{self.records_filename}.tmp"
+        rows = self.connection.execute(
+            "SELECT id, feed, offset, length FROM records ORDER BY offset"
+        ).fetchall()
+        with open(self.records_filename, "rb") as src, open(tmp, "wb") as dst:
+            moved = []
+            for cve_id, feed, offset, length in rows:
+                src.seek(offset)
+                moved.append((dst.tell(), cve_id, feed))
+                dst.write(src.read(length))
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE records SET offset = ? WHERE id = ? AND feed = ?", moved
+            )
+            os.replace(tmp, self.records_filename)
+
+    def close(self):
+        if self.records is not None:
+            self.records.close()
+            self.records = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, cve_id):
+        """Returns the record of a CVE.
+
+        Args:
+            cve_id (str): The CVE id, e.g. "CVE-2021-44228".
+
+        Returns:
+            dict: The record, see `cve_record`, or None when no feed has it.
+        """
+        row = self.connection.execute(
+            "SELECT offset, length FROM records WHERE id = ?"
+            " ORDER BY last_modified DESC LIMIT 1",
+            (cve_id.upper(),),
+        ).fetchone()
+        if row is None:
+            return None
+        self.records.seek(row[0])
+        return json.loads(self.records.read(row[1]))
+
+
+def enrich_cves(data, index):
+    """Completes the CVEs with their CVSS metric, weaknesses and references.
+
+    Only the CVEs referenced by EMB3D are looked up. The CVSS metric is stored
+    in the x_cvss_* properties. Each CWE of the CVE is added as an external
+    reference, and linked with a related-to relationship when the weakness is
+    part of the bundle.
+
+    Args:
+        data (dict): The dict containing actual objects.
+        index (NvdIndex): The open index of the feeds.
+
+    Returns:
+        None: This function updates the provided data dictionary in place
+              but does not return any value.
+    """
+    for name, draft in data["threats"].items():
+        if not name.startswith("CVE-"):
+            continue
+        record = index.get(name)
+        if record is None:
+            count("nvd.missing")
+            continue
+        refs = [
+            {
+                "source_name": "cve",
+                "external_id": name,
+                "url": f"https://nvd.nist.gov/vuln/detail/{name}",
+            }
+        ]
+        for cwe in record["cwes"]:
+            refs.append({"source_name": "cwe", "external_id": cwe})
+            if cwe in data["weaknesses"]:
+                data["relationships"].add(
+                    draft["id"], data["weaknesses"][cwe]["id"], "related-to"
+                )
+        refs.extend(
+            {"source_name": r["source"] or "nvd", "url": r["url"]}
+            for r in record["references"]
+        )
+        cvss = record["cvss"] or {}
+        update_draft(
+            draft,
+            external_references=refs,
+            x_cvss_version=cvss.get("version"),
+            x_cvss_vector=cvss.get("vector"),
+            x_cvss_score=cvss.get("score"),
+            x_cvss_severity=cvss.get("severity"),
+        )
+        count("nvd.enriched")
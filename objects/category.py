@@ -1,4 +1,6 @@
 from stix2 import CustomObject, properties, ExternalReference
+from instrumentation import count
+from utils import stable_properties
 
 
 @CustomObject(
@@ -25,6 +27,7 @@ def make_emb3d_categories(identity_id, tactics):
         A list of Category.
 
     """
+    count("stix_objects.x-mitre-category", len(tactics))
     return [
         Category(
             name=t,
@@ -38,6 +41,7 @@ def make_emb3d_categories(identity_id, tactics):
                 }
             ],
             created_by_ref=identity_id,
+            **stable_properties("x-mitre-category", t),
         )
         for t in tactics
     ]
@@ -1,12 +1,15 @@
-import json
-from utils import clean, create_or_update_stix_obj, create_relationship
+from utils import (
+    clean,
+    create_or_update_stix_obj,
+    update_draft,
+)
 from stix2 import CourseOfAction, Vulnerability
 
 
-def process_coas(data, filename, identity, keys_to_exclude=None):
-    """Processes course of action data from a JSON file.
+def process_coas(data, mappings, identity, keys_to_exclude=None):
+    """Processes course of action data from the EMB3D mappings.
 
-    This function reads a JSON file containing mitigation data, creates or
+    This function walks the parsed mitigation mappings, creates or
     updates course of action and vulnerability objects, and establishes
     relationships between them. It allows for the exclusion of specified keys
     during the processing of the data.
@@ -14,7 +17,7 @@ def process_coas(data, filename, identity, keys_to_exclude=None):
     Args:
         data (dict): A dictionary that holds existing mitigations, threats,
                      and relationships.
-        filename (str): The path to the JSON file containing mitigation data.
+        mappings (dict): The parsed content of mitigations_threat_mappings.json.
         keys_to_exclude (set, optional): A set of keys to exclude from the
                                            processing. Defaults to None.
 
@@ -22,54 +25,42 @@ def process_coas(data, filename, identity, keys_to_exclude=None):
         None: This function updates the provided data dictionary in place
               but does not return any value.
 
-    Raises:
-        FileNotFoundError: If the specified JSON file does not exist.
-        json.JSONDecodeError: If the file content is not valid JSON.
-
     Examples:
-        process_coas(data_dict, "path/to/file.json")
+        process_coas(data_dict, mappings, identity)
     """
     if keys_to_exclude is None:
         keys_to_exclude = set()
 
-    with open(filename) as f:
-        json_obj = json.loads(f.read())["mitigations"]
-
-        for obj in json_obj:
-            # create main object
-            stix_obj = create_or_update_stix_obj(
-                obj,
-                CourseOfAction,
-                data["mitigations"],
-                identity,
-                keys_to_exclude,
-                **clean(obj, identity, keys_to_exclude)
-            )
-            data["mitigations"][stix_obj["name"]] = stix_obj
+    for obj in mappings["mitigations"]:
+        # create main object
+        stix_obj = create_or_update_stix_obj(
+            obj,
+            CourseOfAction,
+            data["mitigations"],
+            identity,
+            keys_to_exclude,
+            **clean(obj, identity, keys_to_exclude)
+        )
 
-            # manage related items
-            for rel_obj in obj.get("threats", []):
-                name = rel_obj["id"]
-                try:
-                    stix_rel_obj = data["threats"][name]
-                    stix_rel_obj = stix_rel_obj.new_version(
-                        **clean(rel_obj, None, keys_to_exclude)
-                    )
-                except KeyError:
-                    stix_rel_obj = create_or_update_stix_obj(
-                        rel_obj,
-                        Vulnerability,
-                        data["threats"],
-                        identity,
-                        keys_to_exclude,
-                        **clean(rel_obj, identity, keys_to_exclude)
-                    )
-                    data["threats"][stix_rel_obj["name"]] = stix_rel_obj
+        # manage related items
+        for rel_obj in obj.get("threats", []):
+            name = rel_obj["id"]
+            try:
+                stix_rel_obj = update_draft(
+                    data["threats"][name], **clean(rel_obj, None, keys_to_exclude)
+                )
+            except KeyError:
+                stix_rel_obj = create_or_update_stix_obj(
+                    rel_obj,
+                    Vulnerability,
+                    data["threats"],
+                    identity,
+                    keys_to_exclude,
+                    **clean(rel_obj, identity, keys_to_exclude)
+                )
 
-                # relation could be reversed
-                from_id, to_id = stix_obj.id, stix_rel_obj.id
+            # relation could be reversed
+            from_id, to_id = stix_obj["id"], stix_rel_obj["id"]
 
-                # create relationship
-                data["relationships"].append(
-                    create_relationship(from_id, to_id, "mitigates")
-                )
+            # create relationship
+            data["relationships"].add(from_id, to_id, "mitigates")
@@ -1,4 +1,6 @@
 from stix2 import Identity
+from instrumentation import count
+from utils import stable_properties
 
 
 def make_emb3d_identity():
@@ -12,5 +14,7 @@ def make_emb3d_identity():
         name="EMB3D",
         identity_class="organization",
         description="The EMB3D Threat Model provides a cultivated knowledge base of cyber threats to embedded devices, providing a common understanding of these threats with security mechanisms to mitigate them.",
+        **stable_properties("identity", "EMB3D"),
     )
+    count("stix_objects.identity")
     return [identity]
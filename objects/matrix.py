@@ -1,5 +1,7 @@
 from stix2 import CustomObject
 from stix2.properties import StringProperty, ListProperty, ReferenceProperty
+from instrumentation import count
+from utils import stable_properties
 
 
 @CustomObject(
@@ -43,5 +45,7 @@ def make_emb3d_matrix(categories):
         external_references=external_references,
         category_refs=categories,
         allow_custom=True,
+        **stable_properties("x-mitre-matrix", name),
     )
+    count("stix_objects.x-mitre-matrix")
     return [matrix]
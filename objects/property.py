@@ -1,5 +1,4 @@
-import json
-from utils import clean, create_or_update_stix_obj, create_relationship
+from utils import clean, create_or_update_stix_obj
 from stix2 import CustomObject, Vulnerability
 from stix2.properties import (
     ExtensionsProperty,
@@ -46,10 +45,10 @@ class Property(object):
         pass
 
 
-def process_props(data, filename, identity, keys_to_exclude=None):
-    """Processes property data from a JSON file.
+def process_props(data, mappings, identity, keys_to_exclude=None):
+    """Processes property data from the EMB3D mappings.
 
-    This function reads a JSON file containing property data, creates or
+    This function walks the parsed property mappings, creates or
     updates property and vulnerability objects, and establishes relationships
     between them. It also allows for the exclusion of specified keys during
     the processing of the data.
@@ -57,7 +56,7 @@ def process_props(data, filename, identity, keys_to_exclude=None):
     Args:
         data (dict): A dictionary that holds existing properties, threats,
                      and relationships.
-        filename (str): The path to the JSON file containing property data.
+        mappings (dict): The parsed content of properties_threat_mappings.json.
         keys_to_exclude (set, optional): A set of keys to exclude from the
                                            processing. Defaults to None.
 
@@ -65,53 +64,41 @@ def process_props(data, filename, identity, keys_to_exclude=None):
         None: This function updates the provided data dictionary in place
               but does not return any value.
 
-    Raises:
-        FileNotFoundError: If the specified JSON file does not exist.
-        json.JSONDecodeError: If the file content is not valid JSON.
-
     Examples:
-        process_props(data_dict, "path/to/file.json")
+        process_props(data_dict, mappings, identity)
     """
     if keys_to_exclude is None:
         keys_to_exclude = set()
 
-    with open(filename) as f:
-        json_obj = json.loads(f.read())["properties"]
+    for obj in mappings["properties"]:
+        # create main object
+        stix_obj = create_or_update_stix_obj(
+            obj,
+            Property,
+            data["properties"],
+            identity,
+            keys_to_exclude,
+            **clean(obj, identity, keys_to_exclude)
+        )
 
-        for obj in json_obj:
-            # create main object
-            stix_obj = create_or_update_stix_obj(
-                obj,
+        # manage related items
+        for rel_obj in obj.get("threats", []):
+            stix_rel_obj = create_or_update_stix_obj(
+                rel_obj,
+                Vulnerability,
+                data["threats"],
+                identity,
+                keys_to_exclude,
+                **clean(rel_obj, identity, keys_to_exclude)
+            )
+            data["relationships"].add(stix_obj["id"], stix_rel_obj["id"], "indicates")
+
+        for rel_obj in obj.get("subProps", []):
+            stix_rel_obj = create_or_update_stix_obj(
+                {"id": rel_obj},
                 Property,
                 data["properties"],
                 identity,
                 keys_to_exclude,
-                **clean(obj, identity, keys_to_exclude)
             )
-            data["properties"][stix_obj["name"]] = stix_obj
-
-            # manage related items
-            for rel_obj in obj.get("threats", []):
-                stix_rel_obj = create_or_update_stix_obj(
-                    rel_obj,
-                    Vulnerability,
-                    data["threats"],
-                    identity,
-                    keys_to_exclude,
-                    **clean(rel_obj, identity, keys_to_exclude)
-                )
-                data["relationships"].append(
-                    create_relationship(stix_obj.id, stix_rel_obj.id, "indicates")
-                )
-
-            for rel_obj in obj.get("subProps", []):
-                stix_rel_obj = create_or_update_stix_obj(
-                    {"id": rel_obj},
-                    Property,
-                    data["properties"],
-                    identity,
-                    keys_to_exclude,
-                )
-                data["relationships"].append(
-                    create_relationship(stix_rel_obj.id, stix_obj.id, "is-subs-of")
-                )
+            data["relationships"].add(stix_rel_obj["id"], stix_obj["id"], "is-subs-of")
@@ -1,51 +1,66 @@
-import json
-from itertools import combinations
-from utils import clean, create_or_update_stix_obj, create_relationship
+from bisect import bisect_right
+from collections import Counter
+from utils import clean, create_or_update_stix_obj
 from stix2 import CourseOfAction, Vulnerability
 from .property import Property
 
 
-def inner_relationships(data, filepath):
-    """Processes relationships between threats based on a JSON file.
+def inner_relationships(data, mappings, min_shared=1, weighted=False):
+    """Processes relationships between threats based on the property mappings.
 
-    This function reads a JSON file to identify relationships between threats defined
-    in the properties section. It creates "similar-to" relationships for pairs of threats
-    that are associated with the same properties.
+    This function builds a property -> threat incidence index from the property
+    mappings and creates one "similar-to" relationship for each pair of threats
+    that share at least `min_shared` properties. Threats are numbered by first
+    appearance, and each pair is counted once from its lowest-numbered threat,
+    so a pair sharing several properties is not emitted again for each of them.
 
     Args:
         data (dict): The dict containing actual objects
-        filepath (str): The path to the JSON file containing threat relationships.
+        mappings (dict): The parsed content of properties_threat_mappings.json.
+        min_shared (int, optional): The minimum number of shared properties for
+                                    two threats to be similar. Defaults to 1.
+        weighted (bool, optional): Whether to store the number of shared
+                                   properties in the x_shared_properties property
+                                   of the relationships. Defaults to False.
 
     Returns:
         None: This function modifies the global `data` structure but does not return a value.
     """
-    with open(filepath, "r") as f:
-        json_data = json.loads(f.read())
-    rels = [
-        u
-        for u in [
-            [k["id"] for k in x.get("threats", [])] for x in json_data["properties"]
-        ]
-        if len(u) > 1
-    ]
-    for rel in rels:
-        pairs = list(combinations(rel, 2))
-        for start, end in pairs:
-            start_obj = data["threats"][start].id
-            end_obj = data["threats"][end].id
-            data["relationships"].append(
-                create_relationship(
-                    start_obj,
-                    end_obj,
-                    "similar-to",
-                )
+    index, threats, incidence = {}, [], []
+    for prop in mappings["properties"]:
+        members = set()
+        for k in prop.get("threats", []):
+            if k["id"] not in index:
+                index[k["id"]] = len(threats)
+                threats.append(k["id"])
+            members.add(index[k["id"]])
+        if len(members) > 1:
+            incidence.append(sorted(members))
+
+    by_threat = [[] for _ in threats]
+    for members in incidence:
+        for i in members:
+            by_threat[i].append(members)
+
+    for i, props in enumerate(by_threat):
+        shared = Counter()
+        for members in props:
+            shared.update(members[bisect_right(members, i) :])
+        for j, count in sorted(shared.items()):
+            if count < min_shared:
+                continue
+            data["relationships"].add(
+                data["threats"][threats[i]]["id"],
+                data["threats"][threats[j]]["id"],
+                "similar-to",
+                **({"x_shared_properties": count} if weighted else {}),
             )
 
 
-def process_threats(data, filename, identity, keys_to_exclude=None):
-    """Processes threat data from a JSON file.
+def process_threats(data, mappings, identity, keys_to_exclude=None):
+    """Processes threat data from the EMB3D mappings.
 
-    This function reads a JSON file containing threat data, creates or
+    This function walks the parsed threat mappings, creates or
     updates vulnerability and property objects, and establishes relationships
     between them. It also allows for the exclusion of specified keys during
     the processing of the data.
@@ -53,7 +68,8 @@ def process_threats(data, filename, identity, keys_to_exclude=None):
     Args:
         data (dict): A dictionary that holds existing threats, properties,
                      and relationships.
-        filename (str): The path to the JSON file containing threat data.
+        mappings (dict): The parsed content of
+                         threats_properties_mitigations_mappings.json.
         keys_to_exclude (set, optional): A set of keys to exclude from the
                                            processing. Defaults to None.
 
@@ -61,55 +77,43 @@ def process_threats(data, filename, identity, keys_to_exclude=None):
         None: This function updates the provided data dictionary in place
               but does not return any value.
 
-    Raises:
-        FileNotFoundError: If the specified JSON file does not exist.
-        json.JSONDecodeError: If the file content is not valid JSON.
-
     Examples:
-        process_threats(data_dict, "path/to/file.json")
+        process_threats(data_dict, mappings, identity)
     """
     if keys_to_exclude is None:
         keys_to_exclude = set()
 
-    with open(filename) as f:
-        json_obj = json.loads(f.read())["threats"]
-
-        for obj in json_obj:
+    for obj in mappings["threats"]:
+
+        # create main object
+        stix_obj = create_or_update_stix_obj(
+            obj,
+            Vulnerability,
+            data["threats"],
+            identity,
+            keys_to_exclude,
+            **clean(obj, identity, keys_to_exclude)
+        )
+
+        # manage related items
+        for rel_obj in obj.get("properties", []):
+            stix_rel_obj = create_or_update_stix_obj(
+                rel_obj,
+                Property,
+                data["properties"],
+                identity,
+                keys_to_exclude,
+                **clean(rel_obj, identity, keys_to_exclude)
+            )
+            data["relationships"].add(stix_obj["id"], stix_rel_obj["id"], "has")
 
-            # create main object
-            stix_obj = create_or_update_stix_obj(
-                obj,
-                Vulnerability,
-                data["threats"],
+        for rel_obj in obj.get("mitigations", []):
+            stix_rel_obj = create_or_update_stix_obj(
+                rel_obj,
+                CourseOfAction,
+                data["mitigations"],
                 identity,
                 keys_to_exclude,
-                **clean(obj, identity, keys_to_exclude)
+                **clean(rel_obj, identity, keys_to_exclude)
             )
-            data["threats"][stix_obj["name"]] = stix_obj
-
-            # manage related items
-            for rel_obj in obj.get("properties", []):
-                stix_rel_obj = create_or_update_stix_obj(
-                    rel_obj,
-                    Property,
-                    data["properties"],
-                    identity,
-                    keys_to_exclude,
-                    **clean(rel_obj, identity, keys_to_exclude)
-                )
-                data["relationships"].append(
-                    create_relationship(stix_obj.id, stix_rel_obj.id, "has")
-                )
-
-            for rel_obj in obj.get("mitigations", []):
-                stix_rel_obj = create_or_update_stix_obj(
-                    rel_obj,
-                    CourseOfAction,
-                    data["mitigations"],
-                    identity,
-                    keys_to_exclude,
-                    **clean(rel_obj, identity, keys_to_exclude)
-                )
-                data["relationships"].append(
-                    create_relationship(stix_rel_obj.id, stix_obj.id, "mitigates")
-                )
+            data["relationships"].add(stix_rel_obj["id"], stix_obj["id"], "mitigates")
@@ -0,0 +1,226 @@
+import io
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import PurePosixPath
+from bs4 import BeautifulSoup
+from stix2 import Vulnerability
+from instrumentation import count
+from objects.weakness import Weakness
+from utils import make_draft, update_draft
+
+
+objects_info = {
+    "threats": {
+        "code": "TID",
+        "key": "threattitle",
+        # the children of the divs of the article
+        "container": "div",
+    },
+    "mitigations": {
+        "code": "MID",
+        "key": "mitigationTitle",
+        # the children of the article
+        "container": "article",
+    },
+}
+
+# elements that are never extracted as section content
+SKIPPED_TAGS = {"div", "h1", "h2"}
+
+
+def parse_html_page(content, obj_type, parser="html.parser"):
+    """
+    Parses an EMB3D HTML page into a plain extracted record.
+
+        This function has no side effects, so it can safely run in a worker
+        process. The returned record is applied to the data structure by
+        `merge_html_record`.
+
+        The article is walked once, in document order, keeping track of the
+        last h2 heading: every child of a container element (see
+        `objects_info`) is added to the section of that heading.
+
+        Args:
+            content (bytes): The content of the HTML page to be processed.
+            obj_type (str): The type of object being processed, which determines
+                            which sections of the page are extracted.
+            parser (str): The BeautifulSoup parser, e.g. "html.parser" or "lxml".
+
+        Returns:
+            dict: A record with the object type, the object tag (e.g. TID-201)
+                and the page sections, keyed by lowercase heading, in document
+                order.
+
+        Raises:
+            bs4.FeatureNotFound: If the parser is not installed.
+
+        Examples:
+            parse_html_page(source.read("threats/TID-201.html"), "threats", "lxml")
+    """
+    # decoded as a text file would be, with universal newlines
+    markup = io.TextIOWrapper(io.BytesIO(content), encoding="utf-8").read()
+    soup = BeautifulSoup(markup, parser)
+    article = soup.find("article")
+    title = " ".join(article.find("h1").text.split())
+    sections = {"title": title}
+    obj_tag = soup.find("div", {"id": objects_info[obj_type]["key"]}).text
+    container = objects_info[obj_type]["container"]
+
+    prev_h2 = article.find_previous("h2")
+    heading = prev_h2.text.lower() if prev_h2 else ""
+    for tag in article.descendants:
+        if tag.name is None:
+            continue
+        if tag.name == "h2":
+            heading = tag.text.lower()
+        elif tag.name not in SKIPPED_TAGS and tag.parent.name == container:
+            text = tag.get_text(strip=True, separator="\n")
+            sections.setdefault(heading, []).append(" ".join(text.split()))
+
+    return {"obj_type": obj_type, "obj_tag": obj_tag, "sections": sections}
+
+
+def merge_html_record(data, record):
+    """
+    Applies a record extracted from an HTML page to the data structure.
+
+        This is the single-threaded counterpart of `parse_html_page`: it updates
+        the object the page describes and creates the weaknesses, CVEs and
+        relationships referenced by it.
+
+        Args:
+            data (dict): The dict containing actual objects.
+            record (dict): A record returned by `parse_html_page`.
+
+        Returns:
+            None: This function updates the provided data dictionary in place
+                but does not return any value.
+
+        Examples:
+            merge_html_record(data, parse_html_page(content, "threats"))
+    """
+    obj_type, obj_tag = record["obj_type"], record["obj_tag"]
+
+    def update_data(draft, key, value):
+        match key:
+            case "title":
+                return update_draft(draft, name=value)
+            case "description" | "threat description":
+                return update_draft(draft, description="".join(value))
+            case "iec 62443 4-2 mappings":
+                return update_draft(draft, x_iec_62443=value)
+            case "threat maturity and evidence":
+                return update_draft(draft, x_maturity=value)
+            case "references":
+                refs = [
+                    {"source_name": "mitre", "description": ref, "url": url["url"]}
+                    for ref in value
+                    if (url := re.search(r"(?P<url>https?://[^\s]+)", ref))
+                ]
+                return update_draft(draft, external_references=refs)
+            case _:
+                return update_draft(draft, **{key: value})
+
+    draft = data[obj_type][obj_tag]
+    for key, value in record["sections"].items():
+        if key in ["cwe", "cve"]:
+            for item in value:
+                if key == "cwe":
+                    name, *description = item.split(":")
+                    try:
+                        from_id = data["weaknesses"][name]["id"]
+                    except KeyError:
+                        description = " ".join(description).strip()
+                        data["weaknesses"][name] = make_draft(
+                            Weakness,
+                            name=name,
+                            description=description,
+                        )
+                        from_id = data["weaknesses"][name]["id"]
+                elif key == "cve":
+                    try:
+                        name = [x for x in item.split() if x.startswith("CVE-")][0]
+                    except Exception:
+                        continue
+                    try:
+                        from_id = data["threats"][name]["id"]
+                    except KeyError:
+                        data["threats"][name] = make_draft(
+                            Vulnerability,
+                            name=name,
+                            description=item,
+                        )
+                        from_id = data["threats"][name]["id"]
+                data["relationships"].add(from_id, draft["id"], "related-to")
+        else:
+            update_data(draft, key, value)
+
+
+def html_pages(source):
+    """
+    Lists the threat and mitigation pages of an EMB3D tree.
+
+        Args:
+            source (Source): The EMB3D tree.
+
+        Returns:
+            list: (name, object type) tuples, sorted by name (see
+                  `Source.names`), which is the order the records are merged
+                  in.
+    """
+    return [
+        (name, item.parent.stem)
+        for name in source.names()
+        if (item := PurePosixPath(name)).suffix == ".html"
+        and item.parent.stem in objects_info
+        and item.stem[:3] == objects_info[item.parent.stem]["code"]
+    ]
+
+
+def extract_html_records(source, pages, jobs=1, cache=None, parser="html.parser"):
+    """
+    Parses HTML pages, optionally in a pool of worker processes.
+
+        Records are returned in the same order as `pages`, so merging them
+        gives the same result as a serial run. When a cache is given, only
+        the pages whose content changed since they were cached are parsed.
+
+        Args:
+            source (Source): The EMB3D tree.
+            pages (list): (name, object type) tuples, as returned by `html_pages`.
+            jobs (int): The number of worker processes; 1 parses in-process.
+            cache (BuildCache, optional): The build cache. Defaults to None.
+            parser (str): The BeautifulSoup parser. Defaults to "html.parser".
+
+        Returns:
+            list: The records returned by `parse_html_page`.
+    """
+    contents = [source.read(name) for name, _ in pages]
+    records = [None] * len(pages)
+    keys = [None] * len(pages)
+    if cache is not None:
+        for i, (_, obj_type) in enumerate(pages):
+            keys[i] = cache.content_key(contents[i], obj_type, parser)
+            records[i] = cache.load(keys[i])
+    missing = [i for i, record in enumerate(records) if record is None]
+
+    if jobs <= 1 or len(missing) < 2:
+        parsed = [parse_html_page(contents[i], pages[i][1], parser) for i in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = executor.map(
+                parse_html_page,
+                [contents[i] for i in missing],
+                [pages[i][1] for i in missing],
+                repeat(parser),
+                chunksize=max(1, len(missing) // (jobs * 4)),
+            )
+            parsed = list(parsed)
+
+    count("html_pages.parsed", len(missing))
+    for i, record in zip(missing, parsed):
+        records[i] = record
+        if cache is not None:
+            cache.store(keys[i], record)
+    return records
@@ -0,0 +1,139 @@
+import csv
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from export import FileWriter, Writer
+
+# version of the ATT&CK Navigator layer format
+NAVIGATOR_VERSIONS = {"layer": "4.5", "navigator": "4.9.1"}
+
+
+def emb3d_id(obj):
+    """Returns the EMB3D id of an object, e.g. "TID-201" for "TID-201: ..."."""
+    return obj["name"].split(":")[0]
+
+
+def is_threat(obj):
+    """Tells whether an object is an EMB3D threat, and not a CVE."""
+    return obj["type"] == "vulnerability" and not obj["name"].startswith("CVE-")
+
+
+class MatrixCsvWriter(FileWriter):
+    """Writes a CSV matrix of threats by mitigations.
+
+    There is a row per threat and a column per mitigation, and a cell holds
+    the level of the mitigation when it mitigates the threat.
+
+    Args:
+        filename (str): The path of the CSV file.
+    """
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.threats = {}
+        self.mitigations = {}
+        self.mitigates = set()
+
+    def write(self, obj):
+        if is_threat(obj):
+            self.threats[obj["id"]] = obj["name"]
+        elif obj["type"] == "course-of-action":
+            self.mitigations[obj["id"]] = (emb3d_id(obj), obj.get("x_level", "x"))
+        elif obj["type"] == "relationship" and obj["relationship_type"] == "mitigates":
+            self.mitigates.add((obj["source_ref"], obj["target_ref"]))
+
+    def close(self):
+        writer = csv.writer(self.file)
+        writer.writerow(["threat", "name", *(m for m, _ in self.mitigations.values())])
+        for threat, name in self.threats.items():
+            writer.writerow(
+                [
+                    name.split(":")[0],
+                    name,
+                    *(
+                        level if (mitigation, threat) in self.mitigates else ""
+                        for mitigation, (_, level) in self.mitigations.items()
+                    ),
+                ]
+            )
+        super().close()
+        return len(self.threats)
+
+
+class NavigatorWriter(Writer):
+    """Writes an ATT&CK Navigator layer per category of the EMB3D matrix.
+
+    Each layer lists the threats of the category, in the tactic of the
+    category, scored by their number of mitigations.
+
+    Args:
+        directory (str): The directory of the layers, one `<category>.json`
+                         file per category.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.matrix = None
+        self.categories = {}
+        self.threats = []
+        self.scores = Counter()
+
+    def write(self, obj):
+        if obj["type"] == "x-mitre-matrix":
+            self.matrix = obj
+        elif obj["type"] == "x-mitre-category":
+            self.categories[obj["id"]] = obj
+        elif is_threat(obj):
+            self.threats.append(obj)
+        elif obj["type"] == "relationship" and obj["relationship_type"] == "mitigates":
+            self.scores[obj["target_ref"]] += 1
+
+    def layer(self, category):
+        """Returns the layer of a category.
+
+        Args:
+            category: The x-mitre-category object.
+
+        Returns:
+            dict: The layer.
+        """
+        shortname = category["x_mitre_shortname"]
+        techniques = [
+            {
+                "techniqueID": emb3d_id(t),
+                "tactic": shortname,
+                "score": self.scores[t["id"]],
+                "comment": t["name"],
+            }
+            for t in self.threats
+            if t.get("x_category") == shortname
+        ]
+        matrix_name = self.matrix["name"] if self.matrix else "EMB3D"
+        return {
+            "name": f"{matrix_name} - {category['name']}",
+            "versions": NAVIGATOR_VERSIONS,
+            "domain": "emb3d",
+            "description": category["description"],
+            "techniques": techniques,
+            "gradient": {
+                "colors": ["#ff6666", "#ffe766", "#8ec843"],
+                "minValue": 0,
+                "maxValue": max((t["score"] for t in techniques), default=0),
+            },
+            "metadata": [{"name": "category", "value": shortname}],
+        }
+
+    def close(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        refs = self.matrix["category_refs"] if self.matrix else self.categories
+        counts = {}
+        for ref in refs:
+            category = self.categories[ref]
+            layer = self.layer(category)
+            filename = self.directory / f"{category['x_mitre_shortname']}.json"
+            with open(f"{filename}.tmp", "w") as f:
+                json.dump(layer, f, indent=4)
+            os.replace(f"{filename}.tmp", filename)
+            counts[category["x_mitre_shortname"]] = len(layer["techniques"])
+        return counts
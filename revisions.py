@@ -0,0 +1,227 @@
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from cache import BuildCache
+from converter import Converter
+from cwe import CweIndex
+from export import BundleWriter, fan_out
+from instrumentation import count
+from nvd import NvdIndex
+from pages import html_pages, parse_html_page
+from sources import load_sources, open_source
+
+# suffixes removed from the path of a source to name its revision
+SOURCE_SUFFIXES = (".tar.gz", ".tgz", ".tar", ".zip", ".git")
+
+
+def split_spec(spec):
+    """Splits a `[NAME=]PATH[@REF]` revision into its parts.
+
+    Paths may contain "=" and "@", and refs "/" and "@", so the spec is split
+    at each "=" and "@" in turn, fewest splits first, until the path exists.
+    When none does, the name ends at the first "=" and the ref starts at the
+    last "@" after the last "/".
+
+    Args:
+        spec (str): The revision, e.g. "emb3d.git@release/1.0".
+
+    Returns:
+        tuple: The name, or "", the path and the ref, or "".
+    """
+    names = [("", spec)] + [
+        (spec[:i], spec[i + 1 :]) for i, c in enumerate(spec) if c == "="
+    ]
+    for name, location in names:
+        refs = [(location, "")] + [
+            (location[:i], location[i + 1 :])
+            for i in range(len(location) - 1, -1, -1)
+            if location[i] == "@"
+        ]
+        for path, ref in refs:
+            if path and Path(path).exists():
+                return name, path, ref
+    name, separator, location = spec.partition("=")
+    if not separator:
+        name, location = "", spec
+    path, separator, ref = location.rpartition("@")
+    if separator and "/" not in ref:
+        return name, path, ref
+    return name, location, ""
+
+
+class Revision:
+    """An EMB3D revision to build, parsed from `[NAME=]PATH[@REF]`.
+
+    The path and ref may contain "/", "=" and "@" (see `split_spec`), e.g.
+    "emb3d.git@release/1.0" or "/srv/a=b/emb3d.zip".
+
+    The name defaults to the ref, or to the name of the source without its
+    archive suffix, e.g. "emb3d-1.0" for "releases/emb3d-1.0.tar.gz".
+
+    Args:
+        spec (str): The revision, e.g. "emb3d.git@v1.0" or "old=emb3d-1.0.zip".
+    """
+
+    def __init__(self, spec):
+        name, location, ref = split_spec(spec)
+        if not name:
+            name = ref or Path(location).name
+            for suffix in SOURCE_SUFFIXES:
+                name = name.removesuffix(suffix)
+        self.spec = spec
+        self.name = re.sub(r"[^\w.-]", "-", name)
+        self.location = location
+        self.ref = ref or None
+
+
+def prime_cache(revisions, cache, jobs=1, parser="html.parser"):
+    """Parses the inputs of several revisions into the cache, once each.
+
+    The pages are keyed by content, so a page that is the same in several
+    revisions is parsed a single time, and pages already in the cache are not
+    parsed at all.
+
+    Args:
+        revisions (list): The `Revision`s.
+        cache (BuildCache): The shared cache.
+        jobs (int, optional): The number of worker processes. Defaults to 1.
+        parser (str, optional): The BeautifulSoup parser. Defaults to
+                                "html.parser".
+
+    Returns:
+        int: The number of pages parsed.
+    """
+    pending = {}
+    for revision in revisions:
+        with open_source(revision.location, revision.ref) as source:
+            load_sources(source, cache)
+            for name, obj_type in html_pages(source):
+                content = source.read(name)
+                key = cache.content_key(content, obj_type, parser)
+                if key not in pending and key not in cache:
+                    pending[key] = (content, obj_type)
+    count("revisions.pages_shared", len(pending))
+
+    keys = list(pending)
+    contents, obj_types = zip(*pending.values()) if pending else ((), ())
+    if jobs <= 1 or len(keys) < 2:
+        parsed = map(parse_html_page, contents, obj_types, [parser] * len(keys))
+        for key, record in zip(keys, parsed):
+            cache.store(key, record)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = executor.map(
+                parse_html_page,
+                contents,
+                obj_types,
+                [parser] * len(keys),
+                chunksize=max(1, len(keys) // (jobs * 4)),
+            )
+            for key, record in zip(keys, parsed):
+                cache.store(key, record)
+    return len(keys)
+
+
+def build_revision(revision, filename, indent, cache_dir, options):
+    """Builds the bundle of a revision, in a worker process.
+
+    Args:
+        revision (Revision): The revision.
+        filename (Path): The path of the bundle.
+        indent (int): The indentation of the bundle, or None.
+        cache_dir (str): The shared cache directory.
+        options (dict): The other arguments of `Converter`.
+
+    Returns:
+        dict: The name, bundle path, number of objects and build time of the
+              revision.
+    """
+    start = time.perf_counter()
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    writer = BundleWriter(filename, indent)
+    converter = Converter(
+        revision.location, ref=revision.ref, cache_dir=cache_dir, **options
+    )
+    converter.run([partial(fan_out, writers=[writer])])
+    return {
+        "name": revision.name,
+        "bundle": str(filename),
+        "objects": writer.count,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def build_revisions(
+    specs, directory="OUT", jobs=1, cache_dir="OUT/.cache", indent=4, **options
+):
+    """Builds the bundles of several EMB3D revisions concurrently.
+
+    The pages of every revision are first parsed once into the shared,
+    content-addressed build cache (see `prime_cache`), and the CWE and NVD
+    indexes are brought up to date. The revisions are then built in parallel
+    worker processes that only read the cache, so the cost is that of one
+    build plus the pages that differ between revisions.
+
+    Args:
+        specs (list): The revisions, as `[NAME=]PATH[@REF]` strings (see
+                      `Revision`).
+        directory (str, optional): The output directory; the bundle of each
+                                   revision is written to
+                                   `<directory>/<name>/out_stix.json`.
+                                   Defaults to "OUT".
+        jobs (int, optional): The number of worker processes. Defaults to 1.
+        cache_dir (str, optional): The shared cache directory, or None for a
+                                   temporary one. Defaults to "OUT/.cache".
+        indent (int, optional): The indentation of the bundles, or None.
+                                Defaults to 4.
+        **options: The other arguments of `Converter`, the same for every
+                   revision.
+
+    Returns:
+        list: The summaries of `build_revision`, in the order of `specs`.
+
+    Raises:
+        ValueError: If two revisions have the same name.
+
+    Examples:
+        build_revisions(["emb3d.git@v1.0", "emb3d.git@v1.1"], jobs=4)
+    """
+    revisions = [Revision(spec) for spec in specs]
+    names = [revision.name for revision in revisions]
+    if len(set(names)) != len(names):
+        raise ValueError(f"revisions must have distinct names, got {names}")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = cache_dir or tmp
+        prime_cache(
+            revisions,
+            BuildCache(cache_dir),
+            jobs,
+            options.get("html_parser", "html.parser"),
+        )
+        # build the indexes once, the workers only read them
+        if options.get("cwe_xml"):
+            cwe_index = options.get("cwe_index") or Path(cache_dir) / "cwe_index.sqlite"
+            with CweIndex(options["cwe_xml"], cwe_index):
+                options["cwe_index"] = cwe_index
+        if options.get("nvd_feeds"):
+            nvd_index = options.get("nvd_index") or Path(cache_dir) / "nvd_index.sqlite"
+            with NvdIndex(options["nvd_feeds"], nvd_index):
+                options["nvd_index"] = nvd_index
+
+        workers = max(1, min(jobs, len(revisions)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    build_revision,
+                    revision,
+                    Path(directory) / revision.name / "out_stix.json",
+                    indent,
+                    cache_dir,
+                    options,
+                )
+                for revision in revisions
+            ]
+            return [future.result() for future in futures]
@@ -0,0 +1,258 @@
+"""Serves lookups over a converted EMB3D bundle on a local HTTP API.
+
+    python server.py --bundle OUT/out_stix.json --port 8080
+
+Endpoints (ids are EMB3D ids such as TID-201 or STIX ids):
+
+    GET /objects/<id>                      the object
+    GET /objects/<id>/related?type=T&direction=in|out|both
+                                           the objects one hop away
+    GET /objects/<id>/traverse?path=in:has,in:mitigates
+                                           the objects reached hop by hop
+    GET /categories/<category>             the objects of an x_category
+    GET /relationships/<type>              the relationships of a type
+
+The bundle is reloaded when its file changes. Lookups are answered with 503
+until it can be read.
+"""
+
+import argparse
+import json
+import os
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from sources import load_json
+
+# directions of the relationships to follow from an object
+DIRECTIONS = ("in", "out", "both")
+
+
+class BundleUnavailable(Exception):
+    """The bundle has not been read yet and cannot be read now."""
+
+
+class ModelIndex:
+    """In-memory indexes over the objects of a bundle.
+
+    Args:
+        objects (list): The STIX objects, as dicts.
+    """
+
+    def __init__(self, objects):
+        self.by_id = {}
+        self.by_emb3d_id = {}
+        self.by_category = defaultdict(list)
+        self.by_relationship_type = defaultdict(list)
+        # id -> relationship type -> ids, in both directions
+        self.edges = {
+            "out": defaultdict(lambda: defaultdict(list)),
+            "in": defaultdict(lambda: defaultdict(list)),
+        }
+        for obj in objects:
+            self.by_id[obj["id"]] = obj
+            if obj["type"] == "relationship":
+                source, target = obj["source_ref"], obj["target_ref"]
+                rel_type = obj["relationship_type"]
+                self.by_relationship_type[rel_type].append(obj["id"])
+                self.edges["out"][source][rel_type].append(target)
+                self.edges["in"][target][rel_type].append(source)
+                continue
+            if "name" in obj:
+                self.by_emb3d_id.setdefault(obj["name"].split(":")[0], obj["id"])
+            if "x_category" in obj:
+                self.by_category[obj["x_category"]].append(obj["id"])
+
+    def resolve(self, key):
+        """Returns the STIX id of an EMB3D or STIX id, or None if unknown."""
+        if key in self.by_id:
+            return key
+        return self.by_emb3d_id.get(key)
+
+    def neighbours(self, ids, direction="both", rel_type=None):
+        """Returns the ids one hop away from `ids`, without duplicates.
+
+        Args:
+            ids (iterable): The STIX ids to start from.
+            direction (str, optional): "out" to follow relationships from their
+                                       source, "in" from their target, or
+                                       "both". Defaults to "both".
+            rel_type (str, optional): The relationship type to follow, or None
+                                      for every type. Defaults to None.
+
+        Returns:
+            list: The STIX ids, in discovery order.
+
+        Raises:
+            ValueError: If the direction is not "in", "out" or "both".
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"invalid direction {direction!r}")
+        directions = ["out", "in"] if direction == "both" else [direction]
+        found = {}
+        for obj_id in ids:
+            for d in directions:
+                edges = self.edges[d].get(obj_id, {})
+                for t in [rel_type] if rel_type else edges:
+                    for other in edges.get(t, []):
+                        found.setdefault(other)
+        return list(found)
+
+    def traverse(self, obj_id, path):
+        """Follows a path of hops from an object.
+
+        Args:
+            obj_id (str): The STIX id to start from.
+            path (list): (direction, relationship type) hops; the type may be
+                         None for every type.
+
+        Returns:
+            list: The STIX ids reached by the last hop.
+        """
+        ids = [obj_id]
+        for direction, rel_type in path:
+            ids = self.neighbours(ids, direction, rel_type)
+        return ids
+
+    def objects(self, ids):
+        """Returns the objects of a list of STIX ids."""
+        return [self.by_id[i] for i in ids if i in self.by_id]
+
+
+class BundleStore:
+    """Holds the index of a bundle file and rebuilds it when the file changes.
+
+    Args:
+        filename (str): The path of the bundle.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.index = None
+        # the bundle may not be built yet, it is read again on each request
+        try:
+            self.get()
+        except BundleUnavailable:
+            pass
+
+    def get(self):
+        """Returns the index of the current content of the bundle.
+
+        If the bundle cannot be read, e.g. while it is being replaced, the
+        previous index is returned and the reload is tried again on next call.
+
+        Raises:
+            BundleUnavailable: If the bundle has never been read.
+        """
+        try:
+            mtime = os.stat(self.filename).st_mtime_ns
+        except OSError as e:
+            if self.index is None:
+                raise BundleUnavailable(f"cannot read {self.filename}: {e}") from e
+            return self.index
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:
+                    try:
+                        self.index = ModelIndex(load_json(self.filename)["objects"])
+                    except (OSError, ValueError, KeyError) as e:
+                        if self.index is None:
+                            raise BundleUnavailable(
+                                f"cannot read {self.filename}: {e!r}"
+                            ) from e
+                    else:
+                        self.mtime = mtime
+        return self.index
+
+
+def parse_path(value):
+    """Parses a traversal path such as "in:has,out:mitigates,both"."""
+    hops = []
+    for hop in value.split(","):
+        direction, _, rel_type = hop.partition(":")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"invalid direction in hop {hop!r}")
+        hops.append((direction, rel_type or None))
+    return hops
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Answers the lookups of the module docstring from a `BundleStore`."""
+
+    store = None
+
+    def send_json(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        try:
+            index = self.store.get()
+            match parts:
+                case ["objects", key, *rest]:
+                    obj_id = index.resolve(key)
+                    if obj_id is None:
+                        return self.send_json(404, {"error": f"unknown id {key}"})
+                    match rest:
+                        case []:
+                            return self.send_json(200, index.by_id[obj_id])
+                        case ["related"]:
+                            ids = index.neighbours(
+                                [obj_id],
+                                query.get("direction", "both"),
+                                query.get("type"),
+                            )
+                        case ["traverse"]:
+                            path = query.get("path")
+                            if path is None:
+                                raise ValueError("missing path parameter")
+                            ids = index.traverse(obj_id, parse_path(path))
+                        case _:
+                            return self.send_json(404, {"error": "unknown endpoint"})
+                case ["categories", category]:
+                    ids = index.by_category.get(category, [])
+                case ["relationships", rel_type]:
+                    ids = index.by_relationship_type.get(rel_type, [])
+                case _:
+                    return self.send_json(404, {"error": "unknown endpoint"})
+        except BundleUnavailable as e:
+            return self.send_json(503, {"error": str(e)})
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+        self.send_json(200, {"objects": index.objects(ids)})
+
+
+def serve(filename, host="127.0.0.1", port=8080):
+    """Serves the lookups over a bundle until interrupted.
+
+    Args:
+        filename (str): The path of the bundle.
+        host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on. Defaults to 8080.
+    """
+    handler = type("Handler", (RequestHandler,), {"store": BundleStore(filename)})
+    with ThreadingHTTPServer((host, port), handler) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--bundle",
+        default="OUT/out_stix.json",
+        help="bundle to serve (default: OUT/out_stix.json)",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    args = parser.parse_args()
+    serve(args.bundle, args.host, args.port)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from stix2.serialization import serialize
+from export import Writer
+from utils import STABLE_TIMESTAMP, make_id
+
+# bytes of a compact bundle around its objects, with a generous id
+ENVELOPE_BYTES = len('{"type":"bundle","id":"bundle--","objects":[]}') + 36
+
+
+def object_refs(obj):
+    """Returns the ids referenced by an object."""
+    refs = []
+    for k, v in obj.items():
+        if k.endswith("_ref"):
+            refs.append(v)
+        elif k.endswith("_refs"):
+            refs.extend(v)
+    return refs
+
+
+def write_shard(filename, bundle_id, texts):
+    """Writes a compact bundle of serialized objects.
+
+    Args:
+        filename (Path): The path of the shard.
+        bundle_id (str): The id of the bundle.
+        texts (list): The serialized objects.
+
+    Returns:
+        tuple: The size in bytes and the SHA-256 digest of the file.
+    """
+    content = (
+        f'{{"type":"bundle","id":"{bundle_id}","objects":[{",".join(texts)}]}}'
+    ).encode()
+    tmp = f"{filename}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, filename)
+    return len(content), hashlib.sha256(content).hexdigest()
+
+
+class Shard:
+    """A bundle being filled by a `ShardWriter`."""
+
+    def __init__(self, number, group, part):
+        self.number = number
+        self.group = group
+        self.name = f"{group}-{part:04d}.json"
+        self.texts = []
+        self.objects = 0
+        self.bytes = ENVELOPE_BYTES
+        self.depends_on = set()
+        self.future = None
+
+
+class ShardWriter(Writer):
+    """Writes the objects as several compact bundles, with a manifest.
+
+    Objects are grouped by STIX type, or by EMB3D category, and each group is
+    split in shards of at most `max_bytes` bytes and `max_objects` objects.
+    By category, a relationship goes to the group of its endpoints when they
+    share one, otherwise to a "relationships" group. Objects are placed once the
+    objects they reference are placed, and an object referencing a shard
+    started after the open shard of its group starts a new shard, so every
+    shard only references objects of itself or of shards listed before it in
+    the manifest; the `depends_on` list of each shard lets uploads run in
+    parallel too.
+
+    Full shards are written by a pool of threads while the next ones are
+    being filled.
+
+    Args:
+        directory (str): The directory of the shards and of `manifest.json`.
+        by (str, optional): "type" or "category". Defaults to "type".
+        max_bytes (int, optional): The maximum size of a shard, or None.
+                                   Defaults to None.
+        max_objects (int, optional): The maximum number of objects of a shard,
+                                     or None. Defaults to None.
+        jobs (int, optional): The number of threads writing shards. Defaults
+                              to 1.
+    """
+
+    def __init__(
+        self, directory, by="type", max_bytes=None, max_objects=None, jobs=1
+    ):
+        if by not in ("type", "category"):
+            raise ValueError(f"cannot shard by {by!r}")
+        self.directory = Path(directory)
+        self.by = by
+        self.max_bytes = max_bytes
+        self.max_objects = max_objects
+        self.jobs = jobs
+        self.shards = []
+        self.current = {}
+        self.shard_of = {}
+        self.group_of = {}
+        self.deferred = []
+        self.executor = None
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # remove the shards of a previous export
+        manifest = self.directory / "manifest.json"
+        if manifest.exists():
+            with open(manifest) as f:
+                for shard in json.load(f)["shards"]:
+                    (self.directory / shard["file"]).unlink(missing_ok=True)
+            manifest.unlink()
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+
+    def group(self, obj):
+        """Returns the group of an object."""
+        if self.by == "type":
+            return obj["type"]
+        if obj["type"] == "relationship":
+            groups = {self.group_of.get(obj["source_ref"], "relationships")}
+            groups.add(self.group_of.get(obj["target_ref"], "relationships"))
+            return groups.pop() if len(groups) == 1 else "relationships"
+        return obj.get("x_category") or obj.get("x_mitre_shortname") or "common"
+
+    def _finish(self, shard):
+        bundle_id = make_id("bundle", f"EMB3D {STABLE_TIMESTAMP.get()} {shard.name}")
+        shard.future = self.executor.submit(
+            write_shard, self.directory / shard.name, bundle_id, shard.texts
+        )
+        shard.objects, shard.texts = len(shard.texts), None
+        del self.current[shard.group]
+
+    def _place(self, obj, text, refs):
+        group = self.group(obj)
+        size = len(text.encode()) + 1
+        depends_on = {self.shard_of[r] for r in refs if r in self.shard_of}
+        shard = self.current.get(group)
+        if shard is not None and (
+            (self.max_bytes and shard.bytes + size > self.max_bytes)
+            or (self.max_objects and len(shard.texts) >= self.max_objects)
+            # the shard would depend on a shard listed after it
+            or any(n > shard.number for n in depends_on)
+        ):
+            self._finish(shard)
+            shard = None
+        if shard is None:
+            part = sum(s.group == group for s in self.shards)
+            shard = self.current[group] = Shard(len(self.shards), group, part)
+            self.shards.append(shard)
+        shard.texts.append(text)
+        shard.bytes += size
+        shard.depends_on.update(depends_on)
+        shard.depends_on.discard(shard.number)
+        self.shard_of[obj["id"]] = shard.number
+        self.group_of[obj["id"]] = group
+
+    def write(self, obj):
+        text = serialize(obj, separators=(",", ":"))
+        refs = object_refs(obj)
+        if all(r in self.shard_of for r in refs):
+            self._place(obj, text, refs)
+        else:
+            self.deferred.append((obj, text, refs))
+
+    def close(self):
+        # objects waiting for later ones, e.g. relationships of weaknesses;
+        # references to objects that are not exported do not hold others
+        while self.deferred:
+            pending = {obj["id"] for obj, _, _ in self.deferred}
+            ready = [d for d in self.deferred if pending.isdisjoint(d[2])]
+            if not ready:
+                raise ValueError(f"circular references between {sorted(pending)}")
+            for obj, text, refs in ready:
+                self._place(obj, text, refs)
+            self.deferred = [
+                d for d in self.deferred if d[0]["id"] not in self.shard_of
+            ]
+        for shard in list(self.current.values()):
+            self._finish(shard)
+        self.executor.shutdown()
+
+        manifest = []
+        for shard in self.shards:
+            size, digest = shard.future.result()
+            manifest.append(
+                {
+                    "file": shard.name,
+                    "group": shard.group,
+                    "objects": shard.objects,
+                    "bytes": size,
+                    "sha256": digest,
+                    "depends_on": sorted(
+                        self.shards[n].name for n in shard.depends_on
+                    ),
+                }
+            )
+        filename = self.directory / "manifest.json"
+        with open(f"{filename}.tmp", "w") as f:
+            json.dump(
+                {
+                    "by": self.by,
+                    "max_bytes": self.max_bytes,
+                    "max_objects": self.max_objects,
+                    "shards": manifest,
+                },
+                f,
+                indent=4,
+            )
+        os.replace(f"{filename}.tmp", filename)
+        return len(manifest)
+
+    def abort(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,367 @@
+import json
+import os
+import subprocess
+import tarfile
+import zipfile
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # optional, faster JSON backend
+    orjson = None
+
+# EMB3D data files, by the name of the mappings they hold
+DATA_FILES = {
+    "mitigations": "_data/mitigations_threat_mappings.json",
+    "properties": "_data/properties_threat_mappings.json",
+    "threats": "_data/threats_properties_mitigations_mappings.json",
+}
+
+
+def source_timestamp(root):
+    """
+    Returns a timestamp that only depends on the EMB3D source.
+
+    This is the date of the last commit touching the source when it is in a
+    git checkout, otherwise the most recent modification time of its files.
+
+    Args:
+        root (str): The path of the EMB3D source.
+
+    Returns:
+        datetime: The timestamp, in UTC.
+    """
+    try:
+        epoch = subprocess.run(
+            ["git", "-C", str(root), "log", "-1", "--format=%ct", "--", "."],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        epoch = ""
+    if not epoch:
+        epoch = max(
+            (f.stat().st_mtime for f in Path(root).rglob("*") if f.is_file()),
+            default=0,
+        )
+    return datetime.fromtimestamp(int(float(epoch)), tz=timezone.utc)
+
+
+def parse_json(content):
+    """Parses JSON content, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def load_json(filename):
+    """
+    Reads and parses a JSON file, with orjson when it is installed.
+
+        Args:
+            filename (str): The path of the JSON file.
+
+        Returns:
+            The parsed content.
+
+        Raises:
+            FileNotFoundError: If the specified JSON file does not exist.
+            ValueError: If the file content is not valid JSON.
+    """
+    with open(filename, "rb") as f:
+        return parse_json(f.read())
+
+
+def find_root(names):
+    """Returns the directory of an EMB3D tree in a list of member names.
+
+    Release archives hold the tree in a top directory, e.g. "emb3d-1.0/".
+
+    Args:
+        names (list): The member names, with "/" separators.
+
+    Returns:
+        str: The prefix of the members of the tree, "" when it is at the top.
+    """
+    for name in names:
+        if name == DATA_FILES["threats"] or name.endswith(f"/{DATA_FILES['threats']}"):
+            return name[: -len(DATA_FILES["threats"])]
+    return ""
+
+
+class Source(ABC):
+    """The files of an EMB3D tree, read by their path in the tree.
+
+    `names` lists the files sorted by name, so every kind of source gives the
+    same order, `read` returns the content of one and `timestamp` the date of
+    the tree used in deterministic mode.
+    """
+
+    @abstractmethod
+    def names(self):
+        pass
+
+    @abstractmethod
+    def read(self, name):
+        pass
+
+    @abstractmethod
+    def timestamp(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DirectorySource(Source):
+    """An EMB3D checkout or extracted tree.
+
+    Args:
+        root (str): The path of the tree.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def names(self):
+        names = []
+        for directory, subdirectories, filenames in os.walk(self.root):
+            subdirectories[:] = [d for d in subdirectories if d != ".git"]
+            prefix = Path(directory).relative_to(self.root).as_posix()
+            for filename in filenames:
+                names.append(filename if prefix == "." else f"{prefix}/{filename}")
+        return sorted(names)
+
+    def read(self, name):
+        with open(self.root / name, "rb") as f:
+            return f.read()
+
+    def timestamp(self):
+        return source_timestamp(self.root)
+
+
+class ZipSource(Source):
+    """A zip release archive, read in place.
+
+    Args:
+        filename (str): The path of the archive.
+    """
+
+    def __init__(self, filename):
+        self.archive = zipfile.ZipFile(filename)
+        self.members = {
+            info.filename: info for info in self.archive.infolist() if not info.is_dir()
+        }
+        self.prefix = find_root(self.members)
+
+    def names(self):
+        return sorted(
+            name[len(self.prefix) :]
+            for name in self.members
+            if name.startswith(self.prefix)
+        )
+
+    def read(self, name):
+        try:
+            return self.archive.read(self.members[self.prefix + name])
+        except KeyError:
+            raise FileNotFoundError(name) from None
+
+    def timestamp(self):
+        dates = [self.members[self.prefix + name].date_time for name in self.names()]
+        return datetime(*max(dates, default=(1980, 1, 1, 0, 0, 0)), tzinfo=timezone.utc)
+
+    def close(self):
+        self.archive.close()
+
+
+class TarSource(Source):
+    """A tar release archive, compressed or not.
+
+    A compressed tar has no index, so the archive is read in a single pass,
+    keeping the content of the JSON and HTML files only.
+
+    Args:
+        filename (str): The path of the archive.
+    """
+
+    # suffixes of the files read by the conversion
+    SUFFIXES = (".json", ".html")
+
+    def __init__(self, filename):
+        self.contents = {}
+        self.mtimes = {}
+        with tarfile.open(filename, "r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = member.name.removeprefix("./")
+                self.mtimes[name] = member.mtime
+                if name.endswith(self.SUFFIXES):
+                    self.contents[name] = archive.extractfile(member).read()
+        self.prefix = find_root(self.mtimes)
+
+    def names(self):
+        return sorted(
+            name[len(self.prefix) :]
+            for name in self.mtimes
+            if name.startswith(self.prefix)
+        )
+
+    def read(self, name):
+        try:
+            return self.contents[self.prefix + name]
+        except KeyError:
+            raise FileNotFoundError(name) from None
+
+    def timestamp(self):
+        epoch = max((self.mtimes[self.prefix + n] for n in self.names()), default=0)
+        return datetime.fromtimestamp(int(epoch), tz=timezone.utc)
+
+
+class GitSource(Source):
+    """The tree of a commit of a git repository, bare or not.
+
+    Files are streamed from the object database by a single
+    `git cat-file --batch` process, without a checkout.
+
+    Args:
+        repository (str): The path of the repository.
+        ref (str, optional): The branch, tag or commit. Defaults to "HEAD".
+
+    Raises:
+        ValueError: If the ref is not a commit of the repository.
+    """
+
+    def __init__(self, repository, ref="HEAD"):
+        self.repository = str(repository)
+        try:
+            self.commit = self._git("rev-parse", "--verify", f"{ref}^{{commit}}")
+        except subprocess.CalledProcessError:
+            raise ValueError(f"{ref!r} is not a commit of {repository}") from None
+        self.commit = self.commit.decode().strip()
+        self.blobs = {}
+        for line in self._git("ls-tree", "-r", "-z", self.commit).split(b"\0"):
+            if line:
+                info, name = line.split(b"\t", 1)
+                _, kind, blob = info.split()
+                if kind == b"blob":
+                    self.blobs[name.decode()] = blob.decode()
+        self.prefix = find_root(self.blobs)
+        self.process = None
+
+    def _git(self, *args):
+        return subprocess.run(
+            ["git", "-C", self.repository, *args], capture_output=True, check=True
+        ).stdout
+
+    def names(self):
+        return sorted(
+            name[len(self.prefix) :]
+            for name in self.blobs
+            if name.startswith(self.prefix)
+        )
+
+    def read(self, name):
+        try:
+            blob = self.blobs[self.prefix + name]
+        except KeyError:
+            raise FileNotFoundError(name) from None
+        if self.process is None:
+            self.process = subprocess.Popen(
+                ["git", "-C", self.repository, "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+        self.process.stdin.write(f"{blob}\n".encode())
+        self.process.stdin.flush()
+        size = int(self.process.stdout.readline().split()[2])
+        content = self.process.stdout.read(size)
+        self.process.stdout.read(1)
+        return content
+
+    def timestamp(self):
+        epoch = self._git(
+            "log", "-1", "--format=%ct", self.commit, "--", self.prefix or "."
+        )
+        return datetime.fromtimestamp(int(epoch or 0), tz=timezone.utc)
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+
+def is_git_repository(path):
+    """Tells whether a directory is a bare git repository."""
+    return (path / "HEAD").is_file() and (path / "objects").is_dir()
+
+
+def open_source(location="emb3d", ref=None):
+    """
+    Opens an EMB3D tree in a directory, a release archive or a git repository.
+
+        Args:
+            location (str): The path of a directory, of a .zip, .tar, .tar.gz
+                            or .tgz archive, or of a git repository.
+            ref (str, optional): The ref to read when `location` is a git
+                                 repository. Bare repositories are read at
+                                 HEAD by default, other directories as they
+                                 are on disk. Defaults to None.
+
+        Returns:
+            Source: The source, to be closed after use.
+
+        Examples:
+            with open_source("emb3d.git", "v1.0") as source:
+                sources = load_sources(source)
+    """
+    path = Path(location)
+    if path.is_dir():
+        if ref is not None or is_git_repository(path):
+            return GitSource(path, ref or "HEAD")
+        return DirectorySource(path)
+    if zipfile.is_zipfile(path):
+        return ZipSource(path)
+    if path.is_file() and tarfile.is_tarfile(path):
+        return TarSource(path)
+    raise FileNotFoundError(f"no EMB3D source at {location}")
+
+
+def load_sources(source, cache=None):
+    """
+    Loads every EMB3D data file once.
+
+        The parsed mappings are shared by all the processors, so each file is
+        read and parsed a single time per run, or not at all when its content
+        is unchanged in the build cache.
+
+        Args:
+            source (Source): The EMB3D tree.
+            cache (BuildCache, optional): The build cache. Defaults to None.
+
+        Returns:
+            dict: The parsed content of each data file, keyed as `DATA_FILES`.
+
+        Examples:
+            sources = load_sources(open_source("emb3d"))
+            process_coas(data, sources["mitigations"], identity)
+    """
+    sources = {}
+    for name, filename in DATA_FILES.items():
+        content = source.read(filename)
+        if cache is None:
+            sources[name] = parse_json(content)
+        else:
+            sources[name] = cache.get_content(content, parse_json)
+    return sources
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+from stix2.serialization import serialize
+from export import Writer, fan_out
+
+# columns of the entity tables, after the STIX id
+ENTITY_COLUMNS = ["emb3d_id", "name", "description", "category"]
+
+# tables of the entities, by STIX type
+ENTITY_TABLES = {
+    "vulnerability": "threats",
+    "course-of-action": "mitigations",
+    "property": "properties",
+    "weakness": "weaknesses",
+    "x-mitre-category": "categories",
+}
+
+SCHEMA = "\n".join(
+    [
+        f"""CREATE TABLE {table} (
+    id TEXT PRIMARY KEY,
+    {", ".join(f"{c} TEXT" for c in ENTITY_COLUMNS)},
+    object TEXT NOT NULL
+);
+CREATE INDEX {table}_emb3d_id ON {table} (emb3d_id);"""
+        for table in [*ENTITY_TABLES.values(), "cves"]
+    ]
+    + [
+        """CREATE INDEX threats_category ON threats (category);
+CREATE TABLE relationships (
+    id TEXT PRIMARY KEY,
+    source_ref TEXT NOT NULL,
+    target_ref TEXT NOT NULL,
+    relationship_type TEXT NOT NULL,
+    object TEXT NOT NULL
+);
+CREATE INDEX relationships_source ON relationships (source_ref, relationship_type);
+CREATE INDEX relationships_target ON relationships (target_ref, relationship_type);"""
+    ]
+)
+
+
+def table_row(obj):
+    """Returns the table and row of an object.
+
+    CVEs are vulnerabilities too, but get their own table. Identities and
+    matrices are not stored.
+
+    Args:
+        obj: The STIX object.
+
+    Returns:
+        tuple: The table name and the row values, in column order, or None
+               when the object is not stored.
+    """
+    if obj["type"] == "relationship":
+        return "relationships", (
+            obj["id"],
+            obj["source_ref"],
+            obj["target_ref"],
+            obj["relationship_type"],
+            serialize(obj),
+        )
+    table = ENTITY_TABLES.get(obj["type"])
+    if table is None:
+        return None
+    emb3d_id = obj["name"].split(":")[0]
+    if table == "threats" and emb3d_id.startswith("CVE-"):
+        table = "cves"
+    return table, (
+        obj["id"],
+        emb3d_id,
+        obj["name"],
+        obj.get("description"),
+        obj.get("x_category", obj.get("x_mitre_shortname")),
+        serialize(obj),
+    )
+
+
+class SqliteWriter(Writer):
+    """Writes the objects to an indexed SQLite database.
+
+    There is a table per kind of object (threats, cves, mitigations,
+    properties, weaknesses, categories and relationships), with the STIX
+    object as JSON in the `object` column. Rows are inserted in batches in a
+    single transaction, and the file is moved over the target once complete.
+
+    Args:
+        filename (str): The path of the database.
+        batch_size (int, optional): The number of rows per insert. Defaults
+                                    to 1000.
+    """
+
+    def __init__(self, filename, batch_size=1000):
+        self.filename = filename
+        self.tmp = f"{filename}.tmp"
+        self.batch_size = batch_size
+        self.connection = None
+        self.counts = dict.fromkeys(
+            [*ENTITY_TABLES.values(), "cves", "relationships"], 0
+        )
+        self.batches = {table: [] for table in self.counts}
+
+    def open(self):
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+        self.connection = sqlite3.connect(self.tmp, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.executescript(SCHEMA)
+        self.connection.execute("BEGIN")
+
+    def _flush(self, table):
+        rows = self.batches[table]
+        marks = ", ".join("?" * len(rows[0]))
+        self.connection.executemany(f"INSERT INTO {table} VALUES ({marks})", rows)
+        self.counts[table] += len(rows)
+        rows.clear()
+
+    def write(self, obj):
+        row = table_row(obj)
+        if row is not None:
+            table, values = row
+            self.batches[table].append(values)
+            if len(self.batches[table]) >= self.batch_size:
+                self._flush(table)
+
+    def close(self):
+        for table, rows in self.batches.items():
+            if rows:
+                self._flush(table)
+        self.connection.execute("COMMIT")
+        self.connection.close()
+        os.replace(self.tmp, self.filename)
+        return self.counts
+
+    def abort(self):
+        if self.connection is not None:
+            self.connection.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def write_sqlite(data, filename, batch_size=1000):
+    """Writes the data structure to an indexed SQLite database.
+
+    See `SqliteWriter`.
+
+    Args:
+        data (dict): The dict containing actual objects.
+        filename (str): The path of the database.
+        batch_size (int, optional): The number of rows per insert. Defaults
+                                    to 1000.
+
+    Returns:
+        dict: The number of rows, by table.
+
+    Examples:
+        write_sqlite(data, "OUT/out_stix.sqlite")
+    """
+    return fan_out(data, [SqliteWriter(filename, batch_size)])[0]
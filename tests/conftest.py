@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "benchmarks")]
+
+from generate_corpus import generate_corpus  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory):
+    """A synthetic EMB3D tree, see `benchmarks/generate_corpus.py`."""
+    root = tmp_path_factory.mktemp("emb3d")
+    generate_corpus(root, scale=0.5)
+    return root
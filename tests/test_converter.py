@@ -0,0 +1,24 @@
+import pytest
+from converter import Converter
+from export import iter_objects
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_relationships_are_stable_after_run(corpus, fast):
+    exported = []
+    data = Converter(corpus, deterministic=True, fast=fast).run(
+        [lambda data: exported.extend(iter_objects(data))]
+    )
+    first = [dict(obj) for obj in data["relationships"]]
+    second = [dict(obj) for obj in data["relationships"]]
+    assert first
+    assert first == second
+    assert first == [dict(obj) for obj in exported if obj["type"] == "relationship"]
+
+
+def test_deterministic_runs_are_identical(corpus):
+    runs = [
+        [dict(obj) for obj in iter_objects(Converter(corpus, deterministic=True).run())]
+        for _ in range(2)
+    ]
+    assert runs[0] == runs[1]
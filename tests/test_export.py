@@ -0,0 +1,29 @@
+import pytest
+from converter import Converter
+from export import JsonLinesWriter, Writer, fan_out, iter_objects
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_deterministic_ids_are_unique(corpus, fast):
+    ids = []
+    Converter(corpus, deterministic=True, fast=fast).run(
+        [lambda data: ids.extend(obj["id"] for obj in iter_objects(data))]
+    )
+    assert len(ids) == len(set(ids))
+
+
+def test_fan_out_rejects_duplicate_ids(corpus, tmp_path):
+    data = Converter(corpus, deterministic=True).run()
+    data["threats"]["copy"] = next(iter(data["threats"].values()))
+    filename = tmp_path / "out.jsonl"
+    with pytest.raises(ValueError, match="duplicate STIX id"):
+        fan_out(data, [JsonLinesWriter(filename)])
+    assert not filename.exists()
+
+
+def test_writer_without_write_cannot_be_instantiated():
+    class Incomplete(Writer):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
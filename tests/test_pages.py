@@ -0,0 +1,89 @@
+import pytest
+from bs4 import BeautifulSoup
+from pages import objects_info, parse_html_page
+from sources import DirectorySource
+
+# the CSS queries of the extraction replaced by the single walk
+QUERIES = {
+    "threats": "article div > *:not(div, h1, h2)",
+    "mitigations": "article > *:not(div, h1, h2)",
+}
+
+
+def select_html_page(content, obj_type):
+    """Extracts a page with a CSS query and find_previous, as before."""
+    soup = BeautifulSoup(content.decode("utf-8"), "html.parser")
+    article = soup.find("article")
+    sections = {"title": " ".join(article.find("h1").text.split())}
+    obj_tag = soup.find("div", {"id": objects_info[obj_type]["key"]}).text
+    for tag in article.select(QUERIES[obj_type]):
+        prev_h2 = tag.find_previous("h2")
+        title = prev_h2.text.lower() if prev_h2 else ""
+        text = tag.get_text(strip=True, separator="\n")
+        sections.setdefault(title, []).append(" ".join(text.split()))
+    return {"obj_type": obj_type, "obj_tag": obj_tag, "sections": sections}
+
+
+def page(title, body):
+    return f"""<html><body>{title}<article><h1>The  page
+title</h1>{body}</article></body></html>""".encode()
+
+
+EDGE_CASES = {
+    "heading before the article": (
+        "mitigations",
+        page(
+            "<h2>Outside</h2><p>ignored</p>",
+            '<div id="mitigationTitle">MID-001</div><p>first</p>'
+            "<h2>Description</h2><p>second</p>",
+        ),
+    ),
+    "headings nested in sections": (
+        "threats",
+        page(
+            "",
+            '<div id="threattitle">TID-101</div>'
+            "<section><h2>Threat Description</h2></section>"
+            "<div><p>one</p><section><h2>References</h2><p>two</p></section>"
+            "<p>three https://example.org</p></div>",
+        ),
+    ),
+    "bare text nodes": (
+        "mitigations",
+        page(
+            "",
+            '<div id="mitigationTitle">MID-002</div>text<h2>Description</h2>'
+            "more text<p>a <b>bold</b>\n   word</p>tail",
+        ),
+    ),
+    "nested divs": (
+        "threats",
+        page(
+            "",
+            '<div id="threattitle">TID-102</div><h2>Description</h2>'
+            "<div><p>outer</p><div><p>inner</p><div><ul><li>x</li></ul></div>"
+            "</div><h2>References</h2><p>after</p></div>",
+        ),
+    ),
+}
+
+
+def test_same_records_as_css_queries_on_corpus(corpus):
+    source = DirectorySource(corpus)
+    pages = [
+        (name, name.split("/")[0])
+        for name in source.names()
+        if name.endswith(".html")
+    ]
+    assert pages
+    for name, obj_type in pages:
+        content = source.read(name)
+        assert parse_html_page(content, obj_type) == select_html_page(
+            content, obj_type
+        ), name
+
+
+@pytest.mark.parametrize("case", EDGE_CASES)
+def test_same_records_as_css_queries_on_edge_cases(case):
+    obj_type, content = EDGE_CASES[case]
+    assert parse_html_page(content, obj_type) == select_html_page(content, obj_type)
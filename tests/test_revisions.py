@@ -0,0 +1,45 @@
+import pytest
+from revisions import Revision
+
+
+@pytest.mark.parametrize(
+    "spec, name, location, ref",
+    [
+        ("emb3d.git@v1.0", "v1.0", "emb3d.git", "v1.0"),
+        ("old=emb3d-1.0.zip", "old", "emb3d-1.0.zip", None),
+        ("releases/emb3d-1.0.tar.gz", "emb3d-1.0", "releases/emb3d-1.0.tar.gz", None),
+        ("new=repos/emb3d.git@v1.1", "new", "repos/emb3d.git", "v1.1"),
+        ("/srv/user@host/emb3d.git", "emb3d", "/srv/user@host/emb3d.git", None),
+        ("/srv/user@host/emb3d.git@v2", "v2", "/srv/user@host/emb3d.git", "v2"),
+        ("old=/srv/a=b/u@h/emb3d.zip", "old", "/srv/a=b/u@h/emb3d.zip", None),
+        ("x=me@2024.git@HEAD~1", "x", "me@2024.git", "HEAD~1"),
+    ],
+)
+def test_revision_spec(spec, name, location, ref):
+    revision = Revision(spec)
+    assert (revision.name, revision.location, revision.ref) == (
+        name.replace("/", "-"),
+        location,
+        ref,
+    )
+
+
+def test_revision_spec_of_existing_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for path in ["repo.git", "repo", "a=b", "user@host/emb3d.git"]:
+        (tmp_path / path).mkdir(parents=True)
+    (tmp_path / "a=b" / "emb3d.zip").touch()
+
+    cases = {
+        # refs containing "/"
+        "repo.git@release/1.0": ("release-1.0", "repo.git", "release/1.0"),
+        "repo@origin/main": ("origin-main", "repo", "origin/main"),
+        "new=repo.git@feature/x@y": ("new", "repo.git", "feature/x@y"),
+        # paths containing "=" or "@", without a name
+        "a=b/emb3d.zip": ("emb3d", "a=b/emb3d.zip", None),
+        "user@host/emb3d.git@v1": ("v1", "user@host/emb3d.git", "v1"),
+        "x=a=b/emb3d.zip": ("x", "a=b/emb3d.zip", None),
+    }
+    for spec, expected in cases.items():
+        revision = Revision(spec)
+        assert (revision.name, revision.location, revision.ref) == expected, spec
@@ -0,0 +1,70 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import pytest
+from server import BundleStore, RequestHandler
+
+BUNDLE = {
+    "type": "bundle",
+    "objects": [
+        {"type": "vulnerability", "id": "vulnerability--1", "name": "TID-201: A"},
+        {"type": "course-of-action", "id": "course-of-action--1", "name": "MID-001"},
+        {
+            "type": "relationship",
+            "id": "relationship--1",
+            "relationship_type": "mitigates",
+            "source_ref": "course-of-action--1",
+            "target_ref": "vulnerability--1",
+        },
+    ],
+}
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Serves a bundle file, and returns a function getting a path."""
+    filename = tmp_path / "bundle.json"
+    handler = type("Handler", (RequestHandler,), {"store": BundleStore(filename)})
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def get(path):
+        try:
+            with urlopen(f"http://127.0.0.1:{server.server_port}{path}") as r:
+                return r.status, json.load(r)
+        except HTTPError as e:
+            return e.code, json.load(e)
+
+    yield filename, get
+    server.shutdown()
+    server.server_close()
+
+
+def test_missing_bundle_is_unavailable(serve):
+    filename, get = serve
+    status, body = get("/objects/TID-201")
+    assert status == 503
+    assert "bundle.json" in body["error"]
+
+    filename.write_text("{not json")
+    assert get("/objects/TID-201")[0] == 503
+
+    filename.write_text(json.dumps(BUNDLE))
+    assert get("/objects/TID-201") == (200, BUNDLE["objects"][0])
+
+
+def test_related_direction(serve):
+    filename, get = serve
+    filename.write_text(json.dumps(BUNDLE))
+    status, body = get("/objects/TID-201/related?direction=in&type=mitigates")
+    assert status == 200
+    assert [obj["id"] for obj in body["objects"]] == ["course-of-action--1"]
+
+    assert get("/objects/TID-201/related?direction=foo") == (
+        400,
+        {"error": "invalid direction 'foo'"},
+    )
+    assert get("/objects/TID-201/traverse")[0] == 400
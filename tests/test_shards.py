@@ -0,0 +1,28 @@
+import json
+import pytest
+from converter import Converter
+from export import fan_out
+from shards import ShardWriter, object_refs
+
+
+@pytest.mark.parametrize("by", ["type", "category"])
+def test_shards_only_depend_on_earlier_shards(corpus, tmp_path, by):
+    Converter(corpus, deterministic=True).run(
+        [lambda data: fan_out(data, [ShardWriter(tmp_path, by)])]
+    )
+    with open(tmp_path / "manifest.json") as f:
+        shards = json.load(f)["shards"]
+    position = {shard["file"]: i for i, shard in enumerate(shards)}
+    shard_of = {}
+    for shard in shards:
+        with open(tmp_path / shard["file"]) as f:
+            objects = json.load(f)["objects"]
+        shard_of.update((obj["id"], shard["file"]) for obj in objects)
+        for obj in objects:
+            for ref in object_refs(obj):
+                assert shard_of[ref] == shard["file"] or (
+                    shard_of[ref] in shard["depends_on"]
+                ), (shard["file"], obj["id"], ref)
+    for shard in shards:
+        for name in shard["depends_on"]:
+            assert position[name] < position[shard["file"]], (shard["file"], name)
@@ -0,0 +1,49 @@
+import tarfile
+import zipfile
+import pytest
+from converter import Converter
+from export import iter_objects
+from sources import DirectorySource, Source, open_source
+
+
+def archive_corpus(corpus, tmp_path):
+    """Writes the corpus to a zip and a tar.gz, members in reverse order."""
+    names = DirectorySource(corpus).names()[::-1]
+    with zipfile.ZipFile(tmp_path / "emb3d.zip", "w") as archive:
+        for name in names:
+            archive.write(corpus / name, f"emb3d-1.0/{name}")
+    with tarfile.open(tmp_path / "emb3d.tar.gz", "w:gz") as archive:
+        for name in names:
+            archive.add(corpus / name, f"emb3d-1.0/{name}")
+    return [tmp_path / "emb3d.zip", tmp_path / "emb3d.tar.gz"]
+
+
+def test_names_are_sorted_whatever_the_archive_order(corpus, tmp_path):
+    names = DirectorySource(corpus).names()
+    assert names == sorted(names)
+    for archive in archive_corpus(corpus, tmp_path):
+        with open_source(archive) as source:
+            assert source.names() == names
+
+
+def test_same_objects_from_every_kind_of_source(corpus, tmp_path):
+    def objects(location):
+        data = Converter(location, deterministic=True).run()
+        # the timestamps are those of the source
+        return [
+            {k: v for k, v in obj.items() if k not in ("created", "modified")}
+            for obj in iter_objects(data)
+        ]
+
+    expected = objects(corpus)
+    for archive in archive_corpus(corpus, tmp_path):
+        assert objects(archive) == expected
+
+
+def test_incomplete_source_cannot_be_instantiated():
+    class Incomplete(Source):
+        def names(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
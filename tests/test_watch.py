@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import threading
+import time
+from watch import Watcher
+
+
+def save(path, text):
+    """Replaces a file at once, so it is never polled half-written."""
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def test_failed_rebuild_keeps_the_bundle(corpus, tmp_path):
+    root = tmp_path / "emb3d"
+    shutil.copytree(corpus, root)
+    filename = tmp_path / "out_stix.json"
+    builds, errors = [], []
+    watcher = Watcher(root, filename, deterministic=True, interval=0.01)
+    thread = threading.Thread(
+        target=watcher.watch, args=(lambda *a: builds.append(a), 2, errors.append)
+    )
+    thread.start()
+
+    def wait(condition):
+        deadline = time.monotonic() + 30
+        while not condition():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    wait(lambda: builds)
+    bundle = filename.read_bytes()
+    mappings = root / "_data" / "mitigations_threat_mappings.json"
+    content = mappings.read_text()
+    # saved half-way
+    save(mappings, content[: len(content) // 2])
+    wait(lambda: errors)
+    assert filename.read_bytes() == bundle
+
+    data = json.loads(content)
+    data["mitigations"].append({"id": "MID-999", "name": "Added", "threats": []})
+    save(mappings, json.dumps(data))
+    thread.join(30)
+    assert not thread.is_alive()
+    assert len(builds) == 2 and len(errors) == 1
+    assert builds[1][0]["new"] == 1
+    assert b'"MID-999"' in filename.read_bytes()
+
+
+def test_restored_object_is_a_later_version(corpus, tmp_path):
+    root = tmp_path / "emb3d"
+    shutil.copytree(corpus, root)
+    mappings = root / "_data" / "mitigations_threat_mappings.json"
+    data = json.loads(mappings.read_text())
+    added = json.dumps(
+        {**data, "mitigations": data["mitigations"] + [{"id": "MID-999"}]}
+    )
+    save(mappings, added)
+    delta = tmp_path / "delta_stix.json"
+    deltas = []
+    watcher = Watcher(root, tmp_path / "out_stix.json", delta, interval=0.01)
+    thread = threading.Thread(
+        target=watcher.watch,
+        args=(lambda changes, _: deltas.append((changes, read_objects(delta))), 2),
+    )
+    thread.start()
+
+    def change(text, n):
+        deadline = time.monotonic() + 30
+        while len(deltas) < n:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        save(mappings, text)
+
+    # removed, then restored
+    change(json.dumps(data), 1)
+    change(added, 2)
+    thread.join(30)
+    assert not thread.is_alive()
+    (_, (revoked,)), (changes, (restored,)) = deltas[1:]
+    assert changes == {"new": 0, "changed": 1, "revoked": 0}
+    assert revoked["id"] == restored["id"] and revoked["revoked"]
+    assert not restored.get("revoked")
+    assert restored["created"] == revoked["created"]
+    assert restored["modified"] > revoked["modified"]
+
+
+def read_objects(filename):
+    """Returns the objects of a bundle, or None when it does not exist."""
+    if filename.exists():
+        return json.loads(filename.read_text())["objects"]
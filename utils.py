@@ -1,7 +1,70 @@
 import re
 import uuid
-from stix2 import Relationship
-from stix2.exceptions import UnmodifiablePropertyError
+from array import array
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache, partial
+from stix2 import parse
+from stix2.utils import get_timestamp
+from instrumentation import count
+
+# properties that only live in drafts and never reach the STIX objects
+DRAFT_ONLY_KEYS = {"text"}
+
+# namespace of the UUIDv5 ids generated in deterministic mode
+EMB3D_NAMESPACE = uuid.UUID("4e1d1b0e-7a4c-5b0f-9d2b-3c6e0f5a8e21")
+
+# timestamp of the source in deterministic mode, None for random ids
+STABLE_TIMESTAMP = ContextVar("stable_timestamp", default=None)
+
+
+def make_id(obj_type, key):
+    """
+    Creates a STIX id.
+
+    In deterministic mode (see `STABLE_TIMESTAMP`) the id is a UUIDv5 of the
+    type and key, so the same object gets the same id on every run, otherwise
+    it is random.
+
+    Args:
+        obj_type (str): The STIX type of the object.
+        key (str): A value identifying the object, e.g. its EMB3D id.
+
+    Returns:
+        str: The STIX id.
+    """
+    if STABLE_TIMESTAMP.get() is None:
+        return f"{obj_type}--{uuid.uuid4()}"
+    return stable_id(obj_type, key)
+
+
+# ids are derived twice per draft, and again on every rebuild of a watcher
+@lru_cache(maxsize=1 << 17)
+def stable_id(obj_type, key):
+    """Returns the UUIDv5 id of an object in deterministic mode, see `make_id`."""
+    return f"{obj_type}--{uuid.uuid5(EMB3D_NAMESPACE, f'{obj_type}:{key}')}"
+
+
+def stable_properties(obj_type, key):
+    """
+    Returns the id and timestamps to set on an object in deterministic mode.
+
+    Args:
+        obj_type (str): The STIX type of the object.
+        key (str): A value identifying the object, e.g. its EMB3D id.
+
+    Returns:
+        dict: The id, created and modified properties, or an empty dict when
+              ids are random and stix2 defaults should be used.
+    """
+    timestamp = STABLE_TIMESTAMP.get()
+    if timestamp is None:
+        return {}
+    return {
+        "id": make_id(obj_type, key),
+        "created": timestamp,
+        "modified": timestamp,
+    }
 
 
 def clean(obj, identity=None, keys_to_exclude=None):
@@ -38,67 +101,274 @@ def clean(obj, identity=None, keys_to_exclude=None):
     return tmp
 
 
+def make_draft(obj_type, key=None, **kwargs):
+    """
+    Creates a draft of a STIX object.
+
+    A draft is a plain dictionary holding the properties of a STIX object while
+    it is being built. It has a type and an id from the start, so it can be
+    referenced by relationships, but it is only validated once, when it is
+    materialized.
+
+    Args:
+        obj_type (type): The type of the STIX object the draft will become.
+        key (str, optional): The value the id is derived from in deterministic
+                             mode. Defaults to the name of the object.
+        **kwargs: The properties of the object.
+
+    Returns:
+        dict: The draft.
+    """
+    if key is None:
+        key = kwargs.get("name")
+    return {
+        "type": obj_type._type,
+        "id": make_id(obj_type._type, key),
+        **stable_properties(obj_type._type, key),
+        **kwargs,
+    }
+
+
+def update_draft(draft, **kwargs):
+    """
+    Updates the properties of a draft in place.
+
+    As with stix2 `new_version`, setting a property to None removes it.
+
+    Args:
+        draft (dict): The draft to update.
+        **kwargs: The properties to change.
+
+    Returns:
+        dict: The updated draft.
+    """
+    count("draft_updates")
+    for k, v in kwargs.items():
+        if v is None:
+            draft.pop(k, None)
+        else:
+            draft[k] = v
+    return draft
+
+
+def materialize(data):
+    """
+    Replaces every draft in the data structure with its STIX object.
+
+    This is the only point where drafts are validated by stix2, so every object
+    is built exactly once. Keys in `DRAFT_ONLY_KEYS` are dropped. Relationships
+    are left in their store and only built while they are iterated, see
+    `ExpandedRelationships`.
+
+    Args:
+        data (dict): The dict containing actual objects.
+
+    Returns:
+        None: This function updates the provided data dictionary in place
+              but does not return any value.
+    """
+    for key, objs in data.items():
+        if isinstance(objs, RelationshipStore):
+            count("stix_objects.relationship", len(objs))
+            data[key] = ExpandedRelationships(
+                objs, partial(parse, allow_custom=True, version="2.1")
+            )
+        elif isinstance(objs, dict):
+            for name, draft in objs.items():
+                count(f"stix_objects.{draft['type']}")
+                objs[name] = parse(
+                    {k: v for k, v in draft.items() if k not in DRAFT_ONLY_KEYS},
+                    allow_custom=True,
+                    version="2.1",
+                )
+
+
 def create_or_update_stix_obj(
     obj, obj_type, existing_objs, identity, keys_to_exclude, **kwargs
 ):
     """
-    Create a new STIX object or update an existing one based on the provided parameters.
-    This function manages the lifecycle of STIX objects by either creating a new version or initializing a new object.
+    Create a new draft of a STIX object or update an existing one based on the provided parameters.
 
     Args:
         obj (dict): The object data containing the necessary attributes for STIX object creation.
         obj_type (type): The type of the STIX object to create or update.
-        existing_objs (dict): A dictionary of existing STIX objects indexed by their names.
+        existing_objs (dict): A dictionary of existing drafts indexed by their names.
         identity (str): The identity to associate with the STIX object.
         keys_to_exclude (list): A list of keys to exclude from the object data.
-        **kwargs: Additional keyword arguments for STIX object creation.
+        **kwargs: Additional properties to set on an existing draft.
 
     Returns:
-        dict: The created or updated STIX object.
-
-    Raises:
-        KeyError: If the object ID is not found in existing objects during an update.
+        dict: The created or updated draft.
     """
     name = obj["id"]
     try:
-        stix_obj = existing_objs[name]
-        stix_obj = stix_obj.new_version(**kwargs)
-    except (KeyError, UnmodifiablePropertyError):
-        tmp = clean(obj, identity, keys_to_exclude)
-        prefix = re.sub(r"(?<!^)(?=[A-Z])", "-", obj_type.__name__).lower()
-        stix_obj = obj_type(
-            id=f"{prefix}--{uuid.uuid4()}",
-            allow_custom=True,
+        draft = existing_objs[name]
+    except KeyError:
+        draft = make_draft(
+            obj_type,
             name=name,
             description=obj.get("description", obj.get("text", "")),
-            **tmp,
+            **clean(obj, identity, keys_to_exclude),
         )
-        existing_objs[stix_obj["name"]] = stix_obj
+        existing_objs[name] = draft
+    else:
+        if "description" in obj or "text" in obj:
+            kwargs["description"] = obj.get("description", obj.get("text"))
+        update_draft(draft, **kwargs)
 
-    return stix_obj
+    return draft
 
 
-def create_relationship(from_id, to_id, relationship_type):
-    """Creates a relationship between two entities.
+class RelationshipStore:
+    """Relationships as an edge table over interned STIX ids.
 
-    This function constructs a relationship object that links two entities
-    identified by their IDs. The relationship type defines the nature of the
-    connection between the two entities.
+    A relationship is stored as three integers: the indexes of its source and
+    target in `refs` and of its type in `types`. Its draft, with id and
+    timestamps, is only built when it is expanded (see `draft`), so the table
+    stays small however many relationships the catalogue has. Adding a
+    relationship that already exists returns the existing edge, so each
+    relationship is built once however many mappings declare it. Skipped
+    duplicates are counted by relationship type in `duplicates`.
 
-    Args:
-        from_id (str): The ID of the source entity in the relationship.
-        to_id (str): The ID of the target entity in the relationship.
-        relationship_type (str): The type of relationship being established.
+    The mode of the ids (see `STABLE_TIMESTAMP`) is read when relationships
+    are added, so the drafts are the same wherever they are expanded, e.g.
+    after `Converter.run` returned.
+    """
 
-    Returns:
-        Relationship: A relationship object representing the connection
-                       between the two entities.
+    def __init__(self):
+        self.refs = []
+        self.types = []
+        self.sources = array("L")
+        self.targets = array("L")
+        self.kinds = array("H")
+        # additional properties, by edge
+        self.properties = {}
+        # random ids, 16 bytes per edge, unused in deterministic mode
+        self.uuids = bytearray()
+        # timestamp of the relationships: the source's in deterministic mode,
+        # otherwise the creation of the store
+        self.created = get_timestamp()
+        self.stable_timestamp = None
+        self.duplicates = Counter()
+        self._ref_index = {}
+        self._type_index = {}
+        self._edges = {}
 
-    Examples:
-        create_relationship("entity1", "entity2", "related-to")
+    def __len__(self):
+        return len(self.sources)
+
+    def intern(self, ref):
+        """Returns the index of a STIX id in `refs`, adding it if needed."""
+        try:
+            return self._ref_index[ref]
+        except KeyError:
+            self.refs.append(ref)
+            index = self._ref_index[ref] = len(self.refs) - 1
+            return index
+
+    def add(self, from_id, to_id, relationship_type, **properties):
+        """Adds a relationship unless it already exists.
+
+        Args:
+            from_id (str): The ID of the source entity in the relationship.
+            to_id (str): The ID of the target entity in the relationship.
+            relationship_type (str): The type of relationship being established.
+            **properties: Additional properties of the relationship, set on the
+                          existing one if it already exists.
+
+        Returns:
+            int: The number of the edge.
+        """
+        kind = self._type_index.get(relationship_type)
+        if kind is None:
+            self.types.append(relationship_type)
+            kind = self._type_index[relationship_type] = len(self.types) - 1
+        source, target = self.intern(from_id), self.intern(to_id)
+        key = (source << 32 | target) << 16 | kind
+        edge = self._edges.get(key)
+        if edge is None:
+            edge = self._edges[key] = len(self.sources)
+            self.sources.append(source)
+            self.targets.append(target)
+            self.kinds.append(kind)
+            timestamp = STABLE_TIMESTAMP.get()
+            if timestamp is None:
+                self.uuids += uuid.uuid4().bytes
+            else:
+                self.stable_timestamp = timestamp
+            count("relationships.created")
+        else:
+            self.duplicates[relationship_type] += 1
+            count("relationships.duplicates")
+        if properties:
+            self.properties.setdefault(edge, {}).update(properties)
+        return edge
+
+    def edge(self, edge):
+        """Returns the source id, target id and type of an edge."""
+        return (
+            self.refs[self.sources[edge]],
+            self.refs[self.targets[edge]],
+            self.types[self.kinds[edge]],
+        )
+
+    def draft(self, edge):
+        """Builds the draft of the relationship of an edge.
+
+        Args:
+            edge (int): The number of the edge.
+
+        Returns:
+            dict: The draft, the same each time it is built.
+        """
+        from_id, to_id, relationship_type = self.edge(edge)
+        refs = {
+            "source_ref": from_id,
+            "target_ref": to_id,
+            "relationship_type": relationship_type,
+        }
+        if self.uuids:
+            random_id = uuid.UUID(bytes=bytes(self.uuids[edge * 16 : edge * 16 + 16]))
+            draft = {
+                "type": "relationship",
+                "id": f"relationship--{random_id}",
+                **refs,
+                "created": self.created,
+                "modified": self.created,
+            }
+        else:
+            key = f"{from_id} {relationship_type} {to_id}"
+            draft = {
+                "type": "relationship",
+                "id": stable_id("relationship", key),
+                "created": self.stable_timestamp,
+                "modified": self.stable_timestamp,
+                **refs,
+            }
+        draft.update(self.properties.get(edge, ()))
+        return draft
+
+    def drafts(self):
+        """Yields the draft of every relationship, in insertion order."""
+        for edge in range(len(self)):
+            yield self.draft(edge)
+
+
+class ExpandedRelationships:
+    """The objects of a relationship store, expanded one at a time on iteration.
+
+    Args:
+        store (RelationshipStore): The relationships.
+        expand (callable): Builds the object of a draft.
     """
-    return Relationship(
-        source_ref=from_id,
-        target_ref=to_id,
-        relationship_type=relationship_type,
-    )
+
+    def __init__(self, store, expand):
+        self.store = store
+        self.expand = expand
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        for draft in self.store.drafts():
+            yield self.expand(draft)
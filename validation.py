@@ -0,0 +1,173 @@
+from functools import lru_cache
+from stix2.registry import class_for_type
+from stix2.utils import NOW, PREFIX_21_REGEX, get_timestamp
+from instrumentation import count
+from utils import DRAFT_ONLY_KEYS, ExpandedRelationships, RelationshipStore
+
+
+class ValidationError(ValueError):
+    """Raised when objects of the final set do not match their STIX schema.
+
+    Args:
+        errors (list): The messages, one per invalid property or object.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        shown = "\n".join(errors[:20])
+        more = f"\n... and {len(errors) - 20} more" if len(errors) > 20 else ""
+        super().__init__(f"{len(errors)} invalid STIX properties:\n{shown}{more}")
+
+
+@lru_cache(maxsize=None)
+def schema(obj_type):
+    """Returns the properties of a STIX type and the ones it requires.
+
+    Args:
+        obj_type (str): The STIX type, e.g. "vulnerability" or "x-mitre-category".
+
+    Returns:
+        tuple: The properties by name, in serialization order, and the set of
+               required property names.
+    """
+    cls = class_for_type(obj_type, "2.1")
+    if cls is None:
+        raise ValidationError([f"{obj_type}: unknown STIX type"])
+    return cls._properties, {n for n, p in cls._properties.items() if p.required}
+
+
+def check_object(draft, now, errors):
+    """Validates a draft against the schema of its type.
+
+    Properties are cleaned with the same stix2 property classes used on object
+    construction, defaults are filled in and optional properties left at their
+    default are dropped, so the result serializes like the stix2 object.
+
+    Args:
+        draft (dict): The draft.
+        now (datetime): The value of the timestamps defaulting to the current
+                        time.
+        errors (list): The list the error messages are appended to.
+
+    Returns:
+        dict: The object, with its properties in serialization order.
+    """
+    properties, required = schema(draft["type"])
+    obj = {}
+    for name, prop in properties.items():
+        if name in DRAFT_ONLY_KEYS:
+            continue
+        value = draft.get(name)
+        if value in (None, []):
+            if not hasattr(prop, "default"):
+                continue
+            value = prop.default()
+            if value is NOW:
+                value = now
+        try:
+            value = prop.clean(value, True)[0]
+        except Exception as e:
+            errors.append(f"{draft['id']}: {name}: {e}")
+            continue
+        if (
+            not prop.required
+            and not hasattr(prop, "_fixed_value")
+            and hasattr(prop, "default")
+            and prop.default() == value
+        ):
+            continue
+        obj[name] = value
+    missing = required - obj.keys()
+    if missing:
+        errors.append(f"{draft['id']}: missing {', '.join(sorted(missing))}")
+    for name in sorted(draft.keys() - properties.keys() - DRAFT_ONLY_KEYS):
+        if not PREFIX_21_REGEX.match(name):
+            errors.append(f"{draft['id']}: invalid custom property {name}")
+        elif draft[name] not in (None, []):
+            obj[name] = draft[name]
+    return obj
+
+
+def check_relationships(store, errors):
+    """Validates the edge table of a relationship store.
+
+    Every interned id, relationship type and additional property is checked
+    once, however many relationships use it, since the rest of a relationship
+    is derived from them.
+
+    Args:
+        store (RelationshipStore): The relationships.
+        errors (list): The list the error messages are appended to.
+
+    Returns:
+        callable: Builds the plain object of a draft of the store.
+    """
+    properties, required = schema("relationship")
+    for name, values in [
+        ("source_ref", store.refs),
+        ("relationship_type", store.types),
+    ]:
+        for value in values:
+            try:
+                properties[name].clean(value, True)
+            except Exception as e:
+                errors.append(f"relationship: {name}: {e}")
+    extra = {}
+    for props in store.properties.values():
+        extra.update(props)
+    for name, value in extra.items():
+        if name in properties:
+            try:
+                properties[name].clean(value, True)
+            except Exception as e:
+                errors.append(f"relationship: {name}: {e}")
+        elif not PREFIX_21_REGEX.match(name):
+            errors.append(f"relationship: invalid custom property {name}")
+    timestamps = {}
+
+    def expand(draft):
+        created = draft["created"]
+        if id(created) not in timestamps:
+            timestamps[id(created)] = properties["created"].clean(created, True)[0]
+        draft["created"] = draft["modified"] = timestamps[id(created)]
+        draft["spec_version"] = "2.1"
+        obj = {name: draft[name] for name in properties if name in draft}
+        for name in sorted(draft.keys() - properties.keys()):
+            obj[name] = draft[name]
+        return obj
+
+    return expand
+
+
+def validate_objects(data):
+    """
+    Replaces every draft in the data structure with a validated plain object.
+
+    This is the fast alternative to `utils.materialize`: no stix2 object is
+    built, every draft is checked once against the schema of its type,
+    including the custom property, weakness, category and matrix types, and
+    all the errors are reported together at the end. Relationships are
+    checked through their edge table and expanded while they are iterated.
+
+    Args:
+        data (dict): The dict containing actual objects.
+
+    Returns:
+        None: This function updates the provided data dictionary in place
+              but does not return any value.
+
+    Raises:
+        ValidationError: If any draft does not match its schema.
+    """
+    now = get_timestamp()
+    errors = []
+    for key, objs in data.items():
+        if isinstance(objs, RelationshipStore):
+            count("stix_objects.relationship", len(objs))
+            data[key] = ExpandedRelationships(objs, check_relationships(objs, errors))
+        elif isinstance(objs, dict):
+            for name, draft in objs.items():
+                count(f"stix_objects.{draft['type']}")
+                objs[name] = check_object(draft, now, errors)
+    if errors:
+        raise ValidationError(errors)
@@ -0,0 +1,279 @@
+import os
+import time
+import traceback
+from contextvars import copy_context
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from pathlib import Path
+from stix2 import parse
+from converter import Converter
+from export import BundleWriter, fan_out, write_bundle
+from instrumentation import count
+from pages import extract_html_records, html_pages
+from sources import DATA_FILES, DirectorySource, open_source, parse_json
+from utils import DRAFT_ONLY_KEYS, STABLE_TIMESTAMP, ExpandedRelationships
+
+
+class CachedBundleWriter(BundleWriter):
+    """A `BundleWriter` that serializes each object once.
+
+    Args:
+        filename (str): The path of the bundle file.
+        indent (int): The indentation of the JSON output, or None.
+        texts (dict): The serialized objects, by id, with the object they were
+                      serialized from. Shared by the writers of a watcher.
+    """
+
+    def __init__(self, filename, indent, texts):
+        super().__init__(filename, indent)
+        self.texts = texts
+
+    def text(self, obj):
+        cached = self.texts.get(obj["id"])
+        if cached is not None and cached[0] is obj:
+            return cached[1]
+        text = super().text(obj)
+        self.texts[obj["id"]] = (obj, text)
+        return text
+
+
+class Watcher(Converter):
+    """Rebuilds the bundle of an EMB3D directory whenever its files change.
+
+    The tree is polled for changes in the size or modification time of its
+    files. The parsed mapping files and page records are kept between
+    rebuilds and only the touched files are parsed again. The drafts are then
+    assembled as in a full build, which is cheap, and only the drafts that
+    changed are built into STIX objects (as a new version, with a later
+    modified timestamp) and serialized: the other objects are reused as they
+    are. An object revoked by a rebuild that comes back in a later one is a
+    new version of the revoked object, with the same id.
+
+    Ids are always derived from the EMB3D ids, so they are stable across
+    rebuilds. The timestamps are those of the source with `deterministic`,
+    otherwise the start of the session.
+
+    Args:
+        root (str, optional): The path of the EMB3D directory. Defaults to
+                              "emb3d".
+        filename (str, optional): The path of the bundle. Defaults to
+                                  "OUT/out_stix.json".
+        delta (str, optional): The path of a bundle rewritten after each
+                               rebuild with the objects that are new, changed
+                               or revoked since the previous rebuild, or None.
+                               Defaults to None.
+        indent (int, optional): The indentation of the bundles, or None.
+                                Defaults to 4.
+        interval (float, optional): The seconds between two polls. Defaults
+                                    to 0.5.
+        deterministic (bool, optional): Whether to take the timestamps from
+                                        the source. Defaults to False.
+        **options: The other arguments of `Converter`.
+
+    Examples:
+        Watcher("emb3d", deterministic=True).watch(print)
+    """
+
+    def __init__(
+        self,
+        root="emb3d",
+        filename="OUT/out_stix.json",
+        delta=None,
+        indent=4,
+        interval=0.5,
+        deterministic=False,
+        **options,
+    ):
+        super().__init__(root, **options)
+        self.filename = filename
+        self.delta = delta
+        self.indent = indent
+        self.interval = interval
+        self.stable = deterministic
+        # (modification time, size) of the files of the tree, by name
+        self.stamps = {}
+        # parsed mapping files and page records, with the stamp they were read at
+        self.sources = {}
+        self.records = {}
+        # built objects, by id, with the properties they were built from
+        self.objects = {}
+        # revoked objects, by id, so one that comes back is a later version
+        self.revoked = {}
+        self.texts = {}
+        self.seen = set()
+        self.changes = None
+
+    def scan(self):
+        """Returns the stamps of the files of the tree."""
+        stamps = {}
+        for name in DirectorySource(self.root).names():
+            try:
+                stat = os.stat(Path(self.root) / name)
+            except FileNotFoundError:
+                continue
+            stamps[name] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def read_sources(self, source):
+        sources = {}
+        for name, filename in DATA_FILES.items():
+            stamp = self.stamps.get(filename)
+            cached = self.sources.get(name)
+            if cached is None or cached[0] != stamp:
+                cached = self.sources[name] = (stamp, parse_json(source.read(filename)))
+                count("watch.sources_parsed")
+            sources[name] = cached[1]
+        return sources
+
+    def read_pages(self, source):
+        pages = html_pages(source)
+        touched = [
+            (name, obj_type)
+            for name, obj_type in pages
+            if self.records.get(name, (None,))[0] != self.stamps.get(name)
+        ]
+        records = extract_html_records(
+            source, touched, self.jobs, self.cache, self.html_parser
+        )
+        for (name, _), record in zip(touched, records):
+            self.records[name] = (self.stamps.get(name), record)
+        # forget the removed pages
+        self.records = {name: self.records[name] for name, _ in pages}
+        return [self.records[name][1] for name, _ in pages]
+
+    def later(self, modified):
+        """Returns the modified timestamp of a new version of an object."""
+        if self.stable:
+            timestamp = STABLE_TIMESTAMP.get()
+        else:
+            timestamp = datetime.now(tz=timezone.utc)
+        return max(timestamp, modified + timedelta(milliseconds=1))
+
+    def reuse(self, properties):
+        """Returns the object of a draft, built again only when it changed.
+
+        Args:
+            properties (dict): The properties of the object.
+
+        Returns:
+            The STIX object.
+        """
+        obj_id = properties["id"]
+        self.seen.add(obj_id)
+        previous = self.objects.get(obj_id)
+        if previous is not None and previous[0] == properties:
+            return previous[1]
+        # the previous version, or the revoked one when the object comes back
+        base = previous[1] if previous is not None else self.revoked.get(obj_id)
+        if base is None:
+            obj = parse(properties, allow_custom=True, version="2.1")
+            self.changes["new"].append(obj)
+        else:
+            obj = parse(
+                {
+                    **properties,
+                    "created": base["created"],
+                    "modified": self.later(base["modified"]),
+                },
+                allow_custom=True,
+                version="2.1",
+            )
+            self.changes["changed"].append(obj)
+        count("watch.objects_built")
+        self.objects[obj_id] = (properties, obj)
+        return obj
+
+    def build_objects(self, data):
+        for key, objs in data.items():
+            if isinstance(objs, dict):
+                for name, draft in objs.items():
+                    objs[name] = self.reuse(
+                        {k: v for k, v in draft.items() if k not in DRAFT_ONLY_KEYS}
+                    )
+            elif isinstance(objs, list):
+                data[key] = [self.reuse(dict(obj)) for obj in objs]
+            else:
+                data[key] = ExpandedRelationships(objs, self.reuse)
+
+    def rebuild(self):
+        """Rebuilds the bundle, and the delta when it is not the first build.
+
+        If the build fails, the bundle is left as it was and the objects of
+        the failed build are forgotten, so the next rebuild is compared with
+        the last bundle written.
+
+        Returns:
+            dict: The number of new, changed and revoked objects.
+        """
+        first = not self.objects
+        self.changes = {"new": [], "changed": [], "revoked": []}
+        self.seen = set()
+        writer = CachedBundleWriter(self.filename, self.indent, self.texts)
+        objects = dict(self.objects)
+        try:
+            self._run([partial(fan_out, writers=[writer])])
+        except BaseException:
+            self.objects = objects
+            raise
+        for obj_id in self.seen:
+            self.revoked.pop(obj_id, None)
+
+        # objects of the previous build that are gone
+        for obj_id in self.objects.keys() - self.seen:
+            _, old = self.objects.pop(obj_id)
+            self.texts.pop(obj_id, None)
+            revoked = self.revoked[obj_id] = parse(
+                {**old, "revoked": True, "modified": self.later(old["modified"])},
+                allow_custom=True,
+                version="2.1",
+            )
+            self.changes["revoked"].append(revoked)
+        if self.delta and not first:
+            write_bundle(self.changes, self.delta, self.indent)
+        return {k: len(v) for k, v in self.changes.items()}
+
+    def watch(self, callback=None, rebuilds=None, error_callback=None):
+        """Builds the bundle, then rebuilds it on every change of the tree.
+
+        A build that fails, e.g. on a file saved half-way or an invalid page,
+        leaves the last bundle in place, and the tree keeps being watched: the
+        next change is built again.
+
+        Args:
+            callback (callable, optional): Called after each build with the
+                                           counts of `rebuild` and the build
+                                           time in seconds. Defaults to None.
+            rebuilds (int, optional): The number of rebuilds after which to
+                                      return, or None to watch until
+                                      interrupted. Defaults to None.
+            error_callback (callable, optional): Called with the exception of
+                                                 each failed build. Defaults
+                                                 to printing its traceback.
+        """
+        copy_context().run(self._watch, callback, rebuilds, error_callback)
+
+    def _watch(self, callback, rebuilds, error_callback):
+        if self.stable:
+            with open_source(self.root) as source:
+                STABLE_TIMESTAMP.set(source.timestamp())
+        else:
+            STABLE_TIMESTAMP.set(datetime.now(tz=timezone.utc).replace(microsecond=0))
+        builds = 0
+        while rebuilds is None or builds <= rebuilds:
+            stamps = self.scan()
+            if stamps != self.stamps:
+                self.stamps = stamps
+                start = time.perf_counter()
+                builds += 1
+                try:
+                    changes = self.rebuild()
+                except Exception as e:
+                    if error_callback is None:
+                        traceback.print_exc()
+                    else:
+                        error_callback(e)
+                    continue
+                if callback is not None:
+                    callback(changes, time.perf_counter() - start)
+                continue
+            time.sleep(self.interval)